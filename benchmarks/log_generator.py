@@ -0,0 +1,97 @@
+"""Writes synthetic ETS-364B logfiles shaped like real lots, to measure the interpreter on logfiles of any size.
+    |-> The header rows (120, 125, 140) and 145 warnings of example_log.log, then a TEST_DATA_CONFIG (10) row for each requirement
+    |-> For each device, a TEST_DATA (100) row for each requirement then its TEST_SUMMARY (130) row, with the sites taking turns
+    |-> Measurements fail at fail_rate, a failing device is binned by its first failed requirement
+    |-> With odd_bytes, the bytes the tester writes that are not plain text: U+FFFD in place of a limit and a header field
+        (as in example_log.log), and a unit with a byte that is not valid UTF-8 (µ in latin-1)
+    Run from the root of the repository: python -m benchmarks.log_generator <logfile> --devices 10000
+"""
+import argparse
+import numpy as np
+
+DEFAULT_DEVICE_COUNT = 1000
+DEFAULT_SITE_COUNT = 2
+DEFAULT_REQUIREMENT_COUNT = 20
+DEFAULT_FAIL_RATE = 0.002
+DEFAULT_WARNING_COUNT = 1
+
+# What the tester writes in place of a value it could not format, seen in example_log.log
+REPLACEMENT_BYTES = "\N{REPLACEMENT CHARACTER}".encode("utf-8")
+LINE_END = b",\r\n"
+
+def header_rows(warning_count:int, odd_bytes:bool) -> list[bytes]:
+    "The rows before the TEST_DATA_CONFIG rows."
+    odd = REPLACEMENT_BYTES if odd_bytes else b"?"
+    return [b'120,1,"Model",2,9,"<not specified>","<not specified>","Valued Eagle Customer","EAGLE-num","num","num"',
+            b'125,P,"","","",""',
+            b'140,1,"FILEPATH.DLL","LPROJECT_NAME","1.0","CREATED_DATE","TEST_DATE"',
+            b'140,2,"FILEPATH.pds","LPROJECT_NAME","1.00","CREATED_DATE","TEST_DATE"',
+            b'140,4,"LPROJECT_NAME","' + odd + b'","1.0","CREATED_DATE","TEST_DATE"',
+            *(b'145,"WARNING: Detected Boards using Default Calibration' + (f' ({w+1})'.encode() if w else b"") + b'"'
+              for w in range(warning_count))]
+
+def requirement_limits(requirement_count:int, rng:np.random.Generator) -> tuple[list[str],np.ndarray,np.ndarray]:
+    "(test_ids, lower limits, upper limits) of each requirement, test_ids numbered like 1.1 ... 1.5, 2.1, ..."
+    test_ids = [f"{r//5 + 1}.{r%5 + 1}" for r in range(requirement_count)]
+    centers = rng.choice([0.75, -0.75, 1.5, 0.0, 10.0], size=requirement_count)
+    half_widths = rng.choice([0.25, 0.5, 1.0, 5.0], size=requirement_count)
+    return test_ids, centers - half_widths, centers + half_widths
+
+def config_rows(test_ids:list[str], lower:np.ndarray, upper:np.ndarray, odd_bytes:bool) -> list[bytes]:
+    "A TEST_DATA_CONFIG row for each requirement, the tester writes the upper limit first."
+    units = [b"V", b"mA", b"mV", b"V/mV", b"\xb5A" if odd_bytes else b"uA"]
+    rows = []
+    for r, test_id in enumerate(test_ids):
+        upper_field = REPLACEMENT_BYTES if odd_bytes and r == len(test_ids) - 1 else f"{upper[r]:.3f}".encode()
+        rows.append(b"10,%s,3,%s,%s,\"%s\",\"Test %d\"" % (test_id.encode(), upper_field, f"{lower[r]:.3f}".encode(), units[r % len(units)], r + 1))
+    return rows
+
+def generate_logfile(path:str, device_count:int=DEFAULT_DEVICE_COUNT, site_count:int=DEFAULT_SITE_COUNT,
+                     requirement_count:int=DEFAULT_REQUIREMENT_COUNT, fail_rate:float=DEFAULT_FAIL_RATE,
+                     warning_count:int=DEFAULT_WARNING_COUNT, odd_bytes:bool=True, seed:int=0) -> None:
+    "Writes a synthetic logfile (see the module docstring), the same seed always writes the same bytes."
+    rng = np.random.default_rng(seed)
+    test_ids, lower, upper = requirement_limits(requirement_count, rng)
+    with open(path, mode="wb") as f:
+        f.write(b"".join(row + LINE_END for row in header_rows(warning_count, odd_bytes)))
+        f.write(b"".join(row + LINE_END for row in config_rows(test_ids, lower, upper, odd_bytes)))
+
+        devices_per_chunk = max(1, 100000 // max(requirement_count, 1))
+        for chunk_start in range(0, device_count, devices_per_chunk):
+            devices = range(chunk_start, min(chunk_start + devices_per_chunk, device_count))
+            failed = rng.random((len(devices), requirement_count)) < fail_rate
+            spread = (upper - lower) / 8 # Cpk of about 1.3
+            values = rng.normal((upper + lower) / 2, spread, size=(len(devices), requirement_count))
+            values = np.where(failed, upper + rng.random(failed.shape) * (upper - lower), values) # Out of the limits
+            value_text = np.char.mod("%.3f", values).tolist()
+
+            lines = []
+            for d, device in enumerate(devices):
+                device_failed = failed[d]
+                for r, test_id in enumerate(test_ids):
+                    lines.append(f'100,{test_id},"FAIL","F",{value_text[d][r]},\r\n' if device_failed[r] else
+                                 f'100,{test_id},"    ","P",{value_text[d][r]},\r\n')
+                first_fail = int(device_failed.argmax()) if device_failed.any() else -1
+                lines.append(f'130,{device % site_count + 1},"TEST_DATE  TEST_TIME","<not specified>","{"F" if first_fail >= 0 else "P"}",,,'
+                             f'{first_fail + 2 if first_fail >= 0 else 1},1,0,\r\n')
+            f.write("".join(lines).encode())
+
+def run():
+    parser = argparse.ArgumentParser(description="Writes a synthetic ETS-364B logfile.")
+    parser.add_argument("logfile",type=str)
+    parser.add_argument("-d","--devices",type=int,default=DEFAULT_DEVICE_COUNT)
+    parser.add_argument("-s","--sites",type=int,default=DEFAULT_SITE_COUNT)
+    parser.add_argument("-r","--requirements",type=int,default=DEFAULT_REQUIREMENT_COUNT)
+    parser.add_argument("--fail-rate",type=float,default=DEFAULT_FAIL_RATE,
+                        help=f"Fraction of measurements that fail. Default: {DEFAULT_FAIL_RATE}")
+    parser.add_argument("--warnings",type=int,default=DEFAULT_WARNING_COUNT,
+                        help=f"Number of 145 (warning) rows in the header. Default: {DEFAULT_WARNING_COUNT}")
+    parser.add_argument("--plain",action="store_true",
+                        help="Only write valid UTF-8 text, without the odd bytes the tester writes.")
+    parser.add_argument("--seed",type=int,default=0)
+    args = parser.parse_args()
+    generate_logfile(args.logfile, device_count=args.devices, site_count=args.sites, requirement_count=args.requirements,
+                     fail_rate=args.fail_rate, warning_count=args.warnings, odd_bytes=not args.plain, seed=args.seed)
+
+if __name__ == "__main__":
+    run()
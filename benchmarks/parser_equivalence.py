@@ -0,0 +1,200 @@
+"""Checks that read_test_results() gives the same results as interpreting every row with csv.reader, on logfiles with the rows its fast paths don't expect.
+    |-> The reference is built from interpreted_logfile() (what get_test_results_from_logfile() groups), row by row:
+        each device's TEST_DATA rows go in the column of their test_id (a repeated test_id keeps its last row) up to its TEST_SUMMARY row
+    |-> Synthetic logfiles from benchmarks.log_generator have rows injected into some devices: quoted commas and escaped quotes,
+        145 rows inside a block and multi-line 145 rows, missing, reversed and repeated rows, lower case pass/fail, an odd TEST_SUMMARY row,
+        and no line break on the last row. Each is checked with CRLF and LF line breaks.
+    |-> read_test_results() is checked with 1 and 3 workers, and TEST_RESULTS_BUILDER fed a few bytes at a time (as --follow and --pipeline do)
+    |-> Each RESULTS_FILTER is checked against the filtered reference and RESULTS_FILTER.apply() of the whole results
+    Run from the root of the repository: python -m benchmarks.parser_equivalence  (exits with 1 if any check fails)
+"""
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+import src.logfile_reading as lf
+from src.logfile_following import end_of_complete_devices
+from benchmarks.log_generator import generate_logfile
+
+DEFAULT_DEVICE_COUNT = 60
+DEFAULT_SITE_COUNT = 3
+DEFAULT_REQUIREMENT_COUNT = 6
+DEFAULT_FAIL_RATE = 0.05
+DEFAULT_WORKER_COUNTS = [1, 3]
+DEFAULT_CHUNK_SIZES = [1, 7, 64, 500, 4096]
+
+FILTERS = [lf.RESULTS_FILTER(test_ids=frozenset({"1.2", "2.1"})),
+           lf.RESULTS_FILTER(site_nums=frozenset({1, 3})),
+           lf.RESULTS_FILTER(passed=False),
+           lf.RESULTS_FILTER(passed=True, bin_nums=frozenset({1}), test_ids=frozenset({"1.1"})),
+           lf.RESULTS_FILTER(site_nums=frozenset({9}))]
+
+def unusual_rows(lines:list[bytes]) -> list[bytes]:
+    "The rows of a generated logfile (without line breaks), with the unusual rows injected into its first devices (see the module docstring)."
+    first_device = next(i for i, line in enumerate(lines) if line.startswith(b"100,"))
+    header, devices, rows = lines[:first_device], [], []
+    for line in lines[first_device:]:
+        rows.append(line)
+        if line.startswith(b"130,"):
+            devices.append(rows)
+            rows = []
+
+    def with_field(row:bytes, index:int, field:bytes) -> bytes:
+        "The TEST_DATA row with one of its fields replaced (fields of a generated row have no commas)."
+        fields = row.split(b",")
+        return b",".join(fields[:index] + [field] + fields[index+1:])
+
+    devices[1][1] = with_field(devices[1][1], 2, b'"FA,IL"')                    # Quoted comma
+    devices[2][0] = with_field(devices[2][0], 2, b'"SHORT ""X"""')              # Escaped quotes
+    devices[3].insert(2, b'145,"WARNING: inside a block",')                     # 145 row between TEST_DATA rows
+    devices[4] = devices[4][:-3] + devices[4][-1:]                              # Tester stopped early, last 2 rows missing
+    devices[5] = devices[5][-1:]                                                # No TEST_DATA rows at all
+    devices[6] = devices[6][-2::-1] + devices[6][-1:]                           # Rows in reverse order
+    devices[7].insert(-1, with_field(devices[7][0], 4, b"9.5"))                 # Repeated test_id, with another value
+    devices[8] = [row.replace(b'"P"', b'"p"').replace(b'"F"', b'"f"') for row in devices[8]] # Lower case pass/fail
+    devices[9][-1] = devices[9][-1].replace(b'"<not specified>"', b'"SN,9"')    # Quoted comma in a TEST_SUMMARY row
+    devices[10].insert(0, b'145,"WARNING: over\r\ntwo lines",')                 # Multi-line quoted field
+    devices[11][0] = with_field(devices[11][0], 4, b"1.5e-3")                   # Value in exponent notation
+    return header + [row for rows in devices for row in rows]
+
+def write_unusual_logfile(path:str, line_break:bytes, device_count:int, site_count:int, requirement_count:int, fail_rate:float) -> None:
+    "A generated logfile with the unusual rows injected, every row ending in line_break except the last (each keeps its trailing comma)."
+    generate_logfile(path, device_count=device_count, site_count=site_count, requirement_count=requirement_count, fail_rate=fail_rate)
+    with open(path, mode="rb") as f:
+        lines = f.read().split(b"\r\n")[:-1]
+    rows = [row.replace(b"\r\n", line_break) for row in unusual_rows(lines)]
+    with open(path, mode="wb") as f:
+        f.write(b"".join(row + line_break for row in rows[:-1]) + rows[-1])
+
+def reference_results(logfile:str, results_filter:lf.RESULTS_FILTER|None=None) -> lf.TEST_RESULTS:
+    "The TEST_RESULTS of the logfile built row by row from interpreted_logfile(), kept by the results filter the slow and obvious way."
+    test_ids = None if results_filter is None else results_filter.test_ids
+    config_rows, devices, cells = [], [], {}
+    logfile_sites, device_index = set(), 0
+    for row in lf.interpreted_logfile(logfile, test_ids=test_ids):
+        if isinstance(row, lf.TEST_DATA_CONFIG):
+            config_rows.append(row)
+        elif isinstance(row, lf.TEST_DATA):
+            cells[row.test_id] = row
+        elif isinstance(row, lf.TEST_SUMMARY):
+            logfile_sites.add(row.site_num)
+            if results_filter is None or results_filter.keeps_device(row.site_num, row.bin_num, row.passed):
+                devices.append((device_index, row, cells))
+            device_index += 1
+            cells = {}
+
+    issues = sorted({cell.issue for _, _, cells in devices for cell in cells.values()})
+    shape = (len(devices), len(config_rows))
+    values, passed, present, issue_codes = np.full(shape, np.nan), np.zeros(shape, np.bool_), np.zeros(shape, np.bool_), np.zeros(shape, np.uint16)
+    for d, (_, _, cells) in enumerate(devices):
+        for c, config_row in enumerate(config_rows):
+            cell = cells.get(config_row.test_id)
+            if cell is not None:
+                values[d, c], passed[d, c], present[d, c], issue_codes[d, c] = cell.value, cell.passed, True, issues.index(cell.issue)
+    summaries = [summary for _, summary, _ in devices]
+    device_indexes = np.array([index for index, _, _ in devices], dtype=np.int64)
+    return lf.TEST_RESULTS(config_rows=    config_rows,
+                           test_ids=       np.array([c.test_id for c in config_rows], dtype=np.str_),
+                           values=         values,
+                           packed_passed=  np.packbits(passed, axis=1),
+                           packed_present= np.packbits(present, axis=1),
+                           issue_codes=    issue_codes,
+                           issues=         issues,
+                           test_summaries= summaries,
+                           site_nums=      np.array([s.site_num for s in summaries], dtype=np.int32),
+                           bin_nums=       np.array([s.bin_num for s in summaries], dtype=np.int32),
+                           device_passed=  np.array([s.passed for s in summaries], dtype=np.bool_),
+                           device_indexes= device_indexes,
+                           test_nums=      lf.test_nums_from_device_indexes(device_indexes, len(logfile_sites)))
+
+def differences(results:lf.TEST_RESULTS, expected:lf.TEST_RESULTS) -> list[str]:
+    "What differs between two TEST_RESULTS, issues are compared as strings (the codes are numbered in the order they were found)."
+    if results.values.shape != expected.values.shape:
+        return [f"shape {results.values.shape} != {expected.values.shape}"]
+    found = []
+    if results.config_rows != expected.config_rows:
+        found.append("config_rows")
+    if results.test_summaries != expected.test_summaries:
+        found.append("test_summaries")
+    present = expected.present
+    if not np.array_equal(results.present, present):
+        found.append("present")
+    if not np.array_equal(results.values, expected.values, equal_nan=True):
+        found.append("values")
+    if not np.array_equal(results.passed, expected.passed):
+        found.append("passed")
+    issues, expected_issues = np.array(results.issues or [""]), np.array(expected.issues or [""])
+    if not np.array_equal(issues[results.issue_codes][present], expected_issues[expected.issue_codes][present]):
+        found.append("issues")
+    for name in ("site_nums", "bin_nums", "device_passed", "device_indexes", "test_nums"):
+        if not np.array_equal(getattr(results, name), getattr(expected, name)):
+            found.append(name)
+    return found
+
+def read_in_chunks(logfile:str, chunk_size:int, results_filter:lf.RESULTS_FILTER|None=None) -> lf.TEST_RESULTS:
+    "Reads the logfile with a TEST_RESULTS_BUILDER given chunk_size bytes at a time, each cut after the last complete device like --follow does."
+    builder = lf.TEST_RESULTS_BUILDER(logfile, results_filter=results_filter)
+    pending = b""
+    with open(logfile, mode="rb") as f:
+        while chunk := f.read(chunk_size):
+            data = pending + chunk
+            end = end_of_complete_devices(data)
+            if end:
+                builder.add_data(data, 0, end)
+            pending = data[end:]
+    if pending:
+        builder.add_data(pending)
+    return builder.results()
+
+def check_logfile(logfile:str, worker_counts:list[int], chunk_sizes:list[int]) -> int:
+    "Runs every check on one logfile, printing each, returns the number that failed."
+    failures = 0
+    def check(name:str, results:lf.TEST_RESULTS, expected:lf.TEST_RESULTS) -> None:
+        nonlocal failures
+        found = differences(results, expected)
+        failures += bool(found)
+        print(f"  {'ok' if not found else 'MISMATCH':<8}  {name}" + (f": {', '.join(found)}" if found else ""))
+
+    print(os.path.basename(logfile))
+    expected = reference_results(logfile)
+    for workers in worker_counts:
+        check(f"read_test_results(workers={workers})", lf.read_test_results(logfile, workers=workers), expected)
+    for chunk_size in chunk_sizes:
+        check(f"TEST_RESULTS_BUILDER in {chunk_size} byte chunks", read_in_chunks(logfile, chunk_size), expected)
+
+    whole = lf.read_test_results(logfile)
+    for results_filter in FILTERS:
+        expected = reference_results(logfile, results_filter)
+        check(f"{results_filter}.apply()", results_filter.apply(whole), expected)
+        for workers in worker_counts:
+            check(f"{results_filter} read with workers={workers}", lf.read_test_results(logfile, workers=workers, results_filter=results_filter), expected)
+        check(f"{results_filter} read in {chunk_sizes[0]} byte chunks", read_in_chunks(logfile, chunk_sizes[0], results_filter), expected)
+    return failures
+
+def run():
+    parser = argparse.ArgumentParser(description="Checks read_test_results() against interpreting every row with csv.reader, on logfiles with unusual rows.")
+    parser.add_argument("-d","--devices",type=int,default=DEFAULT_DEVICE_COUNT)
+    parser.add_argument("-s","--sites",type=int,default=DEFAULT_SITE_COUNT)
+    parser.add_argument("-r","--requirements",type=int,default=DEFAULT_REQUIREMENT_COUNT)
+    parser.add_argument("--fail-rate",type=float,default=DEFAULT_FAIL_RATE)
+    parser.add_argument("-w","--workers",type=int,nargs="+",default=DEFAULT_WORKER_COUNTS)
+    parser.add_argument("--chunk-sizes",type=int,nargs="+",default=DEFAULT_CHUNK_SIZES)
+    parser.add_argument("logfiles",type=str,nargs="*",
+                        help="Logfiles to check as well (e.g. example_log.log), on top of the generated ones.")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        logfiles = list(args.logfiles)
+        for name, line_break in (("unusual_crlf.log", b"\r\n"), ("unusual_lf.log", b"\n")):
+            logfiles.append(os.path.join(directory, name))
+            write_unusual_logfile(logfiles[-1], line_break, args.devices, args.sites, args.requirements, args.fail_rate)
+        for logfile in logfiles:
+            failures += check_logfile(logfile, args.workers, args.chunk_sizes)
+
+    print(f"{failures} checks failed" if failures else "All checks passed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,133 @@
+"""Times interpreting synthetic logfiles and writing each output, at several sizes, and saves the results as JSON to compare runs.
+    |-> Each size's logfile is written once by benchmarks.log_generator, with the same seed every run
+    |-> Each stage (parse, then each output format) is measured in a fresh process that first parses the logfile,
+        so its peak memory is that of the stage and parsing only (parse is measured on its own)
+    |-> The fastest of --repeat runs of each stage is kept
+    |-> parse is measured with each of --workers processes (see read_test_results()), to see how reading one logfile scales with cores
+    Run from the root of the repository: python -m benchmarks.suite [--devices 1000 10000 ...] [--compare <earlier results>.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import src.logfile_reading as lf
+from src.output_writers import OUTPUT_WRITERS
+from benchmarks.log_generator import generate_logfile, DEFAULT_REQUIREMENT_COUNT, DEFAULT_SITE_COUNT, DEFAULT_FAIL_RATE
+from benchmarks.xlsx_memory import peak_memory_mb
+
+DEFAULT_DEVICE_COUNTS = [1000, 10000, 50000]
+DEFAULT_STAGES = ["parse", "csv", "xlsx"]
+DEFAULT_WORKER_COUNTS = [1]
+DEFAULT_RESULTS_DIRECTORY = os.path.join("benchmarks", "results")
+
+def measure_stage(logfile:str, stage:str, output_dir:str, workers:int=1) -> dict:
+    "Parses the logfile (in workers processes) then runs the stage (another output format) in this process, returns its seconds and the peak memory."
+    try:
+        import resource # noqa: F401
+    except ImportError:
+        import tracemalloc
+        tracemalloc.start()
+    start = time.perf_counter()
+    results = lf.read_test_results(logfile, workers=workers)
+    seconds = time.perf_counter() - start
+    if stage != "parse":
+        start = time.perf_counter()
+        OUTPUT_WRITERS[stage](results, os.path.join(output_dir, f"benchmark.{stage}"))
+        seconds = time.perf_counter() - start
+    measurements = results.values.size
+    return {"seconds": seconds, "peak_mb": peak_memory_mb(), "measurements": measurements,
+            "measurements_per_second": measurements / seconds if seconds else None}
+
+def git_commit() -> str|None:
+    "The commit the code being measured is at, None outside a git checkout."
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(device_counts:list[int], stages:list[str], requirement_count:int=DEFAULT_REQUIREMENT_COUNT, site_count:int=DEFAULT_SITE_COUNT,
+              fail_rate:float=DEFAULT_FAIL_RATE, repeat:int=1, worker_counts:list[int]=DEFAULT_WORKER_COUNTS) -> dict:
+    "Measures every stage at every size (parse with each of worker_counts processes), returns the results to save as JSON."
+    context = multiprocessing.get_context("spawn") # A fresh process for each measurement, so peaks don't carry over
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        for device_count in device_counts:
+            logfile = os.path.join(directory, f"synthetic_{device_count}.log")
+            start = time.perf_counter()
+            generate_logfile(logfile, device_count=device_count, site_count=site_count, requirement_count=requirement_count, fail_rate=fail_rate)
+            print(f"Generated {device_count} devices ({os.path.getsize(logfile)/2**20:.1f} MB) in {time.perf_counter()-start:.2f}s", file=sys.stderr)
+
+            for stage in stages:
+                for workers in worker_counts if stage == "parse" else [1]: # Only parsing is split between processes
+                    measured = []
+                    for _ in range(repeat):
+                        with ProcessPoolExecutor(1, mp_context=context) as pool: # Not a multiprocessing.Pool, its daemonic process can't start parse workers
+                            measured.append(pool.submit(measure_stage, logfile, stage, directory, workers).result())
+                    best = min(measured, key=lambda m: m["seconds"])
+                    runs.append({"devices": device_count, "requirements": requirement_count, "sites": site_count,
+                                 "logfile_mb": os.path.getsize(logfile) / 2**20, "stage": stage, "workers": workers, **best,
+                                 "peak_mb": max(m["peak_mb"] for m in measured)})
+                    print_run(runs[-1])
+
+    return {"created":      time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit":       git_commit(),
+            "python":       platform.python_version(),
+            "platform":     platform.platform(),
+            "cpu_count":    os.cpu_count(),
+            "repeat":       repeat,
+            "runs":         runs}
+
+def print_run(run:dict, baseline:dict|None=None, file=sys.stdout) -> None:
+    "Prints one measurement, and how it compares to the same measurement of a baseline run."
+    comparison = f"  {run['seconds']/baseline['seconds']:6.2f}x time  {run['peak_mb']-baseline['peak_mb']:+8.1f} MB" if baseline else ""
+    print(f"{run['devices']:>8}  {run['stage']:<10}  {run.get('workers', 1):>7}  {run['seconds']:>8.3f}s  {run['peak_mb']:>8.1f} MB  "
+          f"{run['measurements_per_second']/1e6 if run['measurements_per_second'] else 0:>8.2f} M/s{comparison}", file=file)
+
+def print_comparison(results:dict, baseline:dict, file=sys.stdout) -> None:
+    "Prints every measurement of results next to the same one (size and stage) of the baseline results."
+    print(f"Compared with {baseline.get('created')} (commit {baseline.get('commit')}):", file=file)
+    baseline_runs = {(r["devices"], r["requirements"], r["stage"], r.get("workers", 1)): r for r in baseline["runs"]} # Runs from before --workers used 1
+    for run in results["runs"]:
+        print_run(run, baseline_runs.get((run["devices"], run["requirements"], run["stage"], run.get("workers", 1))), file=file)
+
+def run():
+    parser = argparse.ArgumentParser(description="Times interpreting synthetic logfiles and writing each output, and saves the results as JSON.")
+    parser.add_argument("-d","--devices",type=int,nargs="+",default=DEFAULT_DEVICE_COUNTS)
+    parser.add_argument("-r","--requirements",type=int,default=DEFAULT_REQUIREMENT_COUNT)
+    parser.add_argument("-s","--sites",type=int,default=DEFAULT_SITE_COUNT)
+    parser.add_argument("--fail-rate",type=float,default=DEFAULT_FAIL_RATE)
+    parser.add_argument("--stages",type=str,nargs="+",default=DEFAULT_STAGES,choices=["parse", *OUTPUT_WRITERS])
+    parser.add_argument("-w","--workers",type=int,nargs="+",default=DEFAULT_WORKER_COUNTS,
+                        help="The numbers of processes to parse each logfile with (e.g. 1 2 4 8), the output stages are measured once. Default: 1")
+    parser.add_argument("--repeat",type=int,default=1,
+                        help="Times to measure each stage, the fastest is kept. Default: 1")
+    parser.add_argument("-o","--output",type=str,default=None,
+                        help=f"The JSON file to save the results to. Default: {DEFAULT_RESULTS_DIRECTORY}/<date>_<commit>.json")
+    parser.add_argument("--compare",type=str,default=None,
+                        help="The JSON results of an earlier run to compare with.")
+    args = parser.parse_args()
+
+    print(f"{'Devices':>8}  {'Stage':<10}  {'Workers':>7}  {'Time':>9}  {'Peak':>11}  {'Throughput':>12}")
+    results = run_suite(args.devices, args.stages, requirement_count=args.requirements, site_count=args.sites,
+                        fail_rate=args.fail_rate, repeat=args.repeat, worker_counts=args.workers)
+
+    output = args.output
+    if output is None:
+        output = os.path.join(DEFAULT_RESULTS_DIRECTORY, f"{time.strftime('%Y%m%d_%H%M%S')}_{results['commit'] or 'nocommit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, mode="w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Saved to {output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+if __name__ == "__main__":
+    run()
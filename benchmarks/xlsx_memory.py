@@ -0,0 +1,81 @@
+"""Peak memory of writing the .xlsx output as the number of devices grows, with and without constant_memory.
+    Each size is written in a fresh process from synthetic results, so the peak is only that of building and writing them.
+    Run from the root of the repository: python -m benchmarks.xlsx_memory [device counts...]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+import src.logfile_reading as lf
+from src.excel_writing import results_to_excel
+
+DEFAULT_DEVICE_COUNTS = [1000, 2000, 4000, 8000, 16000, 32000]
+DEFAULT_REQUIREMENT_COUNT = 20
+SITE_COUNT = 2
+
+def synthetic_results(device_count:int, requirement_count:int) -> lf.TEST_RESULTS:
+    "Random TEST_RESULTS shaped like a real lot, 2 sites, about 1% of measurements failing."
+    rng = np.random.default_rng(0)
+    config_rows = [lf.TEST_DATA_CONFIG(test_id=f"{r+1}.1", decimal_position=3, min=1.0, max=0.0, unit="V", name=f"Requirement {r+1}")
+                   for r in range(requirement_count)]
+    passed = rng.random((device_count, requirement_count)) > 0.01
+    device_passed = passed.all(axis=1)
+    test_summaries = [lf.TEST_SUMMARY(site_num=device%SITE_COUNT + 1, time_completed="", serial_num=str(device), passed=bool(device_passed[device]),
+                                      unknown1="", unknown2="", bin_num=1 if device_passed[device] else 2, unknown3="", unknown4="")
+                      for device in range(device_count)]
+    return lf.TEST_RESULTS(config_rows=    config_rows,
+                           test_ids=       np.array([c.test_id for c in config_rows], dtype=np.str_),
+                           values=         rng.random((device_count, requirement_count)).round(3),
+                           packed_passed=  np.packbits(passed, axis=1),
+                           packed_present= np.packbits(np.ones_like(passed), axis=1),
+                           issue_codes=    np.zeros((device_count, requirement_count), dtype=np.uint16),
+                           issues=         ["    "],
+                           test_summaries= test_summaries,
+                           site_nums=      np.array([s.site_num for s in test_summaries], dtype=np.int32),
+                           bin_nums=       np.array([s.bin_num for s in test_summaries], dtype=np.int32),
+                           device_passed=  device_passed,
+                           device_indexes= np.arange(device_count, dtype=np.int64),
+                           test_nums=      lf.test_nums_from_device_indexes(np.arange(device_count, dtype=np.int64), SITE_COUNT))
+
+def peak_memory_mb() -> float:
+    "Peak resident memory of this process (peak traced allocations where the resource module is not available, e.g. Windows)."
+    try:
+        import resource
+    except ImportError:
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10 # KB on Linux
+
+def measure(device_count:int, requirement_count:int, constant_memory:bool) -> tuple[float,float,float]:
+    "(baseline MB, peak MB, seconds) of writing one synthetic workbook, run in its own process."
+    try:
+        import resource # noqa: F401
+    except ImportError:
+        import tracemalloc
+        tracemalloc.start()
+    results = synthetic_results(device_count, requirement_count)
+    baseline = peak_memory_mb()
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        results_to_excel(results, os.path.join(directory, "benchmark.xlsx"), constant_memory=constant_memory)
+        seconds = time.perf_counter() - start
+    return baseline, peak_memory_mb(), seconds
+
+def run():
+    parser = argparse.ArgumentParser(description="Peak memory of writing the .xlsx output as the number of devices grows.")
+    parser.add_argument("device_counts",type=int,nargs="*",default=DEFAULT_DEVICE_COUNTS)
+    parser.add_argument("-r","--requirements",type=int,default=DEFAULT_REQUIREMENT_COUNT)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn") # A fresh process for each measurement, so peaks don't carry over
+    print(f"{'Devices':>8}  {'Mode':<15}  {'Results MB':>10}  {'Peak MB':>8}  {'Seconds':>8}")
+    for device_count in args.device_counts:
+        for constant_memory in (False, True):
+            with context.Pool(1) as pool:
+                baseline, peak, seconds = pool.apply(measure, (device_count, args.requirements, constant_memory))
+            print(f"{device_count:>8}  {'constant_memory' if constant_memory else 'default':<15}  {baseline:>10.1f}  {peak:>8.1f}  {seconds:>8.2f}")
+
+if __name__ == "__main__":
+    run()
@@ -1,305 +1,283 @@
-import argparse
-import csv
-from typing import Any, Protocol,Iterator,Generator
-import sys
-import toml
-from xlsxwriter.workbook import Workbook, Worksheet, Format
-import xlsxwriter.exceptions as xlsx_exceptions 
-import src.logfile_reading as lf
-from src.excel_writing import format_from_config
-
-pyproj_conf = toml.load("./pyproject.toml")
-
-# To Add Better Formatting, see these articles explaining exporting directly to xlsx file:
-# https://techsorber.com/how-to-merge-cells-in-excel-using-python-pandas/
-# https://stackoverflow.com/questions/61217923/merge-rows-based-on-value-pandas-to-excel-xlsxwriter
-# https://xlsxwriter.readthedocs.io/example_merge1.html
-# https://pythonbasics.org/write-excel/
-
-#Extract desired information from pyproject.toml
-authors = pyproj_conf["tool"]["poetry"]["authors"]
-
-program_name = "Interpret Log Files"
-program_description = "Turns the Log Files (.log) of test results into a convenient table (.csv). (Note that the .log file is a specific .csv.)"+\
-                        "This is designed to interpret the output of Eagle's ETS-364B tester."
-program_epilog = f"Author{'s' if len(authors) else ''}: {', '.join([a for a in authors])}"
-
-#Default Values:
-DEFAULT_OUTPUT_NAME = "output"
-
-# Remove referances to allow to be deleted after extracted desired values
-del authors
-del pyproj_conf
-
-parser = argparse.ArgumentParser(prog=program_name,
-                                 description=program_description,
-                                 epilog=program_epilog)
-parser.add_argument('-l','--log',type=str,default=None,
-                   help=f"The file ")
-parser.add_argument('-o','--output',type=str,default=DEFAULT_OUTPUT_NAME,
-                    help= f"The path of the .csv file and .xlsx that this program should output. Default: {DEFAULT_OUTPUT_NAME}.csv & .xlsx")
-
-def run():
-    "Only run parser if directly called."
-    args = parser.parse_args()
-    log_file = args.log
-    output_file = args.output
-    
-    if log_file is None:
-        raise ValueError("No logfile was provided")
-    
-    results_to_csv(logfile=log_file,
-                    targetfile=output_file+".csv")
-    
-    results_to_excel(logfile=log_file,
-                     targetfile=output_file+".xlsx")
-
-def results_to_csv(logfile: str, targetfile: str) -> None:
-    "This takes the logfile and generates a csv outpu in the target file."
-
-    test_config_rows, test_data, test_summaries = lf.get_test_results_from_logfile(logfile)
-    
-    # CSV FORMAT
-    # |               CONFIG INFO                |           Test 1          |
-    # |                                          |    Site 1   |    Site 2   |   ...
-    # | TEST_NUM | Test_Name | Min | Max | Units | Value | P/F | Value | P/F |
-    #        ...
-    # | Overall  |           |     |     |       | result| P/F | result| P/F |
-
-    # Config # rows = 5,   Test # rows = 4,  # Columns = # tests + 4
-
-    # Write results to new csv file
-    site_test_count = len(test_summaries) # each site counts as one test
-    site_count = len(set([ s.site_num for s in test_summaries])) # Collects all site numbers and finds the number of distinct sites, assumes site used in each test
-    test_count = int(site_test_count/site_count)
-
-    testcase_rows = len(test_config_rows)
-
-    assert test_count == int(test_count), "Make sure it and site_count is an integer"
-    
-    try:
-        with open(targetfile, mode="w",newline="\n") as csvfile:
-            csvwriter = csv.writer(csvfile, delimiter=',',quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            
-            # Make Top Level Headers
-            row =  "Config Information,,,,".split(",")
-            for num in range(test_count):
-                row += [f"Test #{num+1}",''] + (["",""]*(site_count-1))
-            csvwriter.writerow(row)
-
-            # Make Second Level Headers
-            row = ",,,,".split(",")
-            for i in range(site_test_count):
-                    row += f"Site {test_summaries[i].site_num},".split(",")
-            csvwriter.writerow(row)
-
-            # Make Third Level Headers
-            row = "#,Name,Max,Min,Unit".split(",")
-            for _ in range(test_count):
-                for _ in range(site_count):
-                    row += "Value,?".split(",")
-            csvwriter.writerow(row)
-
-            # Write rows for all data rows
-            for r in range(testcase_rows):
-                cfg:lf.TEST_DATA_CONFIG = test_config_rows[r]
-                row = [cfg.test_id,
-                    cfg.name,
-                    cfg.min if not None else '',
-                    cfg.max if not None else '',
-                    cfg.unit]
-                for t in range(site_test_count):
-                    data:lf.TEST_DATA = test_data[t][r]
-                    row += [data.value,lf.passed_to_pass_fail(data.passed)]
-                csvwriter.writerow(row)
-
-            # Write Final summary Row
-            row = "Overall,,,,".split(",")
-            for i in range(site_test_count):
-                row += ['',lf.passed_to_pass_fail(test_summaries[i].passed)]
-            csvwriter.writerow(row)
-
-    except PermissionError as e:
-        raise type(e)(str(e) + f"You may have this file open in another program.'").with_traceback(sys.exc_info()[2])
-                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
-
-def results_to_excel(logfile:str, targetfile:str):
-    "Gets results and creates an excel file from them."
-    # CSV FORMAT
-
-    # |               CONFIG INFO                |           Test 1          |
-    # |                                          |    Site 1   |    Site 2   |   ...
-    # | TEST_NUM | Test_Name | Min | Max | Units | Value | P/F | Value | P/F |
-    #        ...
-    # | Overall  |           |     |     |       | result| P/F | result| P/F |
-
-    # Config # rows = 5,   Test # rows = 4,  # Columns = # tests + 4
-
-    # Specify how to build parts in functions
-    def create_config_info(ws: Worksheet,config_info:list[lf.TEST_DATA_CONFIG], first_column:int, first_row:int, 
-                           f_title:Format, f_empty:Format)->None:
-        "Writes config info to the Worksheet as specified in the 'CSV Format' comment in results_to_excel(). This is 5 entries long."
-
-        ws.merge_range(first_row,first_column,first_row+1,first_column+4,"CONFIG INFO",f_title)
-        ws.write_row(first_row+2,first_column,["ID","Test Name", "Max", "Min", "Units"],f_title)
-
-        for row, requirement in enumerate(config_info, start=first_row+3):
-            ws.write(row,first_column  ,requirement.test_id)
-            ws.write(row,first_column+1,requirement.name)
-            if requirement.min is not None:
-                ws.write(row,first_column+2,requirement.min)
-            else:
-                ws.write(row,first_column+2,"",f_empty)
-            if requirement.max is not None:
-                ws.write(row,first_column+3,requirement.max)
-            else:
-                ws.write(row,first_column+3,"",f_empty)
-            ws.write(row,first_column+4,requirement.unit)
-        
-        ws.merge_range(first_row+3+len(config_info),first_column,first_row+3+len(config_info),first_column+4,
-                       "Overall Results:",f_title)
-    
-    def create_test(ws:Worksheet,test_data:list[list[lf.TEST_DATA]],test_summaries:list[lf.TEST_SUMMARY],test_name:str,first_row:int,first_column:int, f_title:Format,
-                     f_pass_datapoint:Format,       f_pass_marker:Format,  f_pass_overall:Format,
-                     f_fail_datapoint:Format,       f_fail_marker:Format,  f_fail_overall:Format)->None:
-        "Generates a test column for the number of sites passed in in test_data, aligning to the 'Test #' part of the 'CSV Format' comment in results_to_excel(). Each test is 4 cells long."
-        
-
-        def create_site(first_row:int,first_column:int,test_data:list[lf.TEST_DATA],test_summary:lf.TEST_SUMMARY):
-            "This is a 2 column long output of a single site. This pulls most of it's arguments from enclosing function."
-            
-            ws.merge_range(first_row,first_column,first_row,first_column+1,f"Site {test_summary.site_num}",f_title)
-            ws.write_row(first_row+1,first_column,["Value","?"],f_title)
-
-            for i, requirement in enumerate(test_data):
-
-                datapoint_format = f_pass_datapoint if requirement.passed else f_fail_datapoint
-                marker_format = f_pass_marker if requirement.passed else f_fail_marker
-
-                ws.write(first_row+2+i,first_column,requirement.value,datapoint_format)
-                ws.write(first_row+2+i,first_column+1,"P" if requirement.passed else "F",marker_format)
-
-            overall_format = f_pass_overall if test_summary.passed else f_fail_overall
-            ws.merge_range(first_row+2+len(test_data),first_column,first_row+2+len(test_data),first_column+1,
-                           "P" if test_summary.passed else "F",overall_format)
-
-        SITE_NUM_COLUMNS = 2
-
-
-        ws.merge_range(first_row,first_column,first_row,first_column+3,test_name,f_title)
-
-        #Create all sites
-        for i, site_data in enumerate(test_data):
-            create_site(first_row=      first_row+1,
-                        first_column=   first_column+(i*SITE_NUM_COLUMNS),
-                        test_data=      site_data,
-                        test_summary=   test_summaries[i])
-            
-    def create_tests(ws:Worksheet,test_data:list[list[lf.TEST_DATA]],test_summaries:list[lf.TEST_SUMMARY],site_count:int,first_row:int,first_column:int, f_title:Format,
-                     f_pass_datapoint:Format,       f_pass_marker:Format,  f_pass_overall:Format,
-                     f_fail_datapoint:Format,       f_fail_marker:Format,  f_fail_overall:Format)->None:
-        "Generates all of the tests for datapoints Filling in the tests... part of the 'CSV Format' comment in results_to_excel(). Each test is 4 cells long."
-        
-        TEST_NUM_COLUMNS = 4
-
-        test_count = int(len(test_data)/site_count)
-
-        for test in range(test_count):
-            create_test(ws=ws,
-                        test_data=test_data             [ test*site_count : (test+1)*site_count ],
-                        test_summaries=test_summaries   [ test*site_count : (test+1)*site_count ],
-                        test_name=f"TEST #{test+1}",
-                        first_row=first_row,
-                        first_column=first_column+(test*TEST_NUM_COLUMNS),
-                        f_title=f_title,
-                        f_pass_datapoint=f_pass_datapoint, f_pass_marker=f_pass_marker, f_pass_overall=f_pass_overall,
-                        f_fail_datapoint=f_fail_datapoint, f_fail_marker=f_fail_marker, f_fail_overall=f_fail_overall)
-
-    def create_requirement_report(ws:Worksheet,requirement:lf.TEST_DATA_CONFIG,requirement_data:list[lf.TEST_DATA],summaries:list[lf.TEST_SUMMARY],
-                                  site_count:int,first_row:int,first_column:int, f_title:Format, 
-                                  f_pass_datapoint:Format,       f_pass_marker:Format,
-                                  f_fail_datapoint:Format,       f_fail_marker:Format)-> None:
-        
-        ws.write_row(first_row,first_column,["ID","Test Name", "Min", "Max", "Units"],f_title)
-        
-        # Write second row (copied from create_config_info)
-        row = first_row + 1
-        ws.write(row,first_column  ,requirement.test_id)
-        ws.write(row,first_column+1,requirement.name)
-        if requirement.min is not None:
-            ws.write(row,first_column+2,requirement.min)
-        else:
-            ws.write(row,first_column+2,"",f_empty)
-        if requirement.max is not None:
-            ws.write(row,first_column+3,requirement.max)
-        else:
-            ws.write(row,first_column+3,"",f_empty)
-        ws.write(row,first_column+4,requirement.unit)
-
-        # skip a column and start writing out results in the following roles
-        column = first_column + 6
-        ws.write_column(first_row,column,[f"T{(i//site_count)+1}-S{(s.site_num)}" for i,s in enumerate(summaries)])
-        for i,data in enumerate(requirement_data):
-            f_datapoint = f_pass_datapoint if data.passed else f_fail_datapoint
-            f_marker = f_pass_marker if data.passed else f_fail_marker
-            ws.write(i,column,f"T{(i//site_count)+1}-S{(summaries[i].site_num)}",f_datapoint)
-            ws.write(i,column+1,"P" if data.passed else "F",f_marker)
-            ws.write(i,column+2,data.value,f_datapoint)
-
-
-    test_config_rows, test_data, test_summaries = lf.get_test_results_from_logfile(logfile)
-
-    #Calculating some useful values
-    site_test_count = len(test_summaries) # each site counts as one test
-    site_count = len(set([ s.site_num for s in test_summaries])) # Collects all site numbers and finds the number of distinct sites, assumes site used in each test
-
-    requirement_count = len(test_config_rows) # Each of the things that will be tested.
-
-    try:
-        with Workbook(targetfile) as wb:
-            all_results = wb.add_worksheet(name="Overall Results")
-
-            # Get formats
-            f_none          = format_from_config(wb,"none")
-            f_pass          = format_from_config(wb,"pass")
-            f_subtle_pass   = format_from_config(wb,"subtle_pass")
-            f_fail          = format_from_config(wb,"fail")
-            f_subtle_fail   = format_from_config(wb,"subtle_fail")
-            f_empty         = format_from_config(wb,"empty")
-            f_title         = format_from_config(wb,"title")
-
-            # Create main results file
-            create_config_info(all_results,test_config_rows,0,0,
-                            f_title=f_title,f_empty=f_empty)
-
-            create_tests(all_results,test_data,test_summaries,site_count,0,5,f_title=f_title,
-                        f_pass_datapoint=f_none,        f_pass_marker=f_pass,  f_pass_overall=f_pass,
-                        f_fail_datapoint=f_subtle_fail, f_fail_marker=f_fail,  f_fail_overall=f_fail)
-            
-            all_results.autofit()
-
-            # Create results file for each requirement
-            for r in range(requirement_count):
-                req_results = wb.add_worksheet(name=f"{test_config_rows[r].test_id}-{test_config_rows[r].name}")
-                create_requirement_report(ws= req_results,
-                                          requirement=test_config_rows[r],
-                                          requirement_data=[d[r] for d in test_data],
-                                          summaries=test_summaries,
-                                          site_count=site_count,
-                                          first_row= 0, 
-                                          first_column=0,
-                                          f_title= f_title,
-                                          f_pass_datapoint=f_subtle_pass, f_pass_marker=f_pass,
-                                          f_fail_datapoint=f_subtle_fail, f_fail_marker=f_fail
-                                          )
-                req_results.autofit()
-
-                
-
-    except (PermissionError,xlsx_exceptions.FileCreateError) as e:
-        raise type(e)(str(e) + f" You may have this file open in another program.'").with_traceback(sys.exc_info()[2])
-                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
-
-
-if __name__ == "__main__":
+import argparse
+import os
+import sys
+import time
+import src.logfile_reading as lf
+import src.profiling as profiling
+from src.output_writers import OUTPUT_WRITERS, write_results
+
+# To Add Better Formatting, see these articles explaining exporting directly to xlsx file:
+# https://techsorber.com/how-to-merge-cells-in-excel-using-python-pandas/
+# https://stackoverflow.com/questions/61217923/merge-rows-based-on-value-pandas-to-excel-xlsxwriter
+# https://xlsxwriter.readthedocs.io/example_merge1.html
+# https://pythonbasics.org/write-excel/
+
+# Next to this file, wherever the program is run from
+PYPROJECT_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyproject.toml")
+
+# src.results_cache and src.lot_store are only imported when --cache or --store is used, so the help shows their defaults as text
+CACHE_DIRECTORY_HELP = os.path.join("~", ".cache", "ets_logfile_interpreter")
+CACHE_SIZE_MB_HELP = 1024
+STORE_PATH_HELP = "lots.sqlite"
+
+program_name = "Interpret Log Files"
+program_description = "Turns the Log Files (.log) of test results into a convenient table (.csv). (Note that the .log file is a specific .csv.)"+\
+                        "This is designed to interpret the output of Eagle's ETS-364B tester."
+
+def program_epilog() -> str:
+    "The authors from pyproject.toml, only read when the help is printed."
+    import toml
+    authors = toml.load(PYPROJECT_FILEPATH)["tool"]["poetry"]["authors"]
+    return f"Author{'s' if len(authors) else ''}: {', '.join([a for a in authors])}"
+
+class PARSER(argparse.ArgumentParser):
+    "An argument parser that only reads its epilog when the help is printed, so a normal run does not read pyproject.toml."
+    def format_help(self) -> str:
+        if self.epilog is None:
+            self.epilog = program_epilog()
+        return super().format_help()
+
+#Default Values:
+DEFAULT_OUTPUT_NAME = "output"
+DEFAULT_OUTPUT_FORMATS = ["csv", "xlsx"]
+
+parser = PARSER(prog=program_name,
+                description=program_description)
+parser.add_argument('-l','--log',type=str,default=None,
+                   help=f"The file ")
+parser.add_argument('-b','--batch',type=str,default=None,
+                   help="A directory (all of its .log files) or glob pattern of logfiles to interpret in a pool of processes, instead of --log.")
+parser.add_argument('-o','--output',type=str,default=None,
+                    help= f"The path of the .csv file and .xlsx that this program should output. Default: {DEFAULT_OUTPUT_NAME}.csv & .xlsx"+\
+                          " With --batch, the directory to write the outputs to, named after each logfile. Default: next to each logfile")
+parser.add_argument('-f','--formats',type=str,nargs="+",default=DEFAULT_OUTPUT_FORMATS,choices=list(OUTPUT_WRITERS),
+                    help= f"The output formats to generate from the logfile, which is only interpreted once for all of them. Default: {' '.join(DEFAULT_OUTPUT_FORMATS)}")
+parser.add_argument('--encoding',type=str,default=lf.LOGFILE_ENCODING,
+                    help= f"The encoding of the strings in the logfile. Default: {lf.LOGFILE_ENCODING}")
+parser.add_argument('--encoding-errors',type=str,default=lf.DEFAULT_ENCODING_ERRORS,choices=["strict","replace","ignore","backslashreplace","surrogateescape"],
+                    help= f"What to do with bytes in the logfile strings that are not valid in the encoding. Default: {lf.DEFAULT_ENCODING_ERRORS}")
+parser.add_argument('--constant-memory',action="store_true",
+                    help= "Write the .xlsx file a row at a time, so memory does not grow with the number of devices. Strings are not shared between cells, so the file is larger.")
+parser.add_argument('--combined-requirements',action="store_true",
+                    help= "Put the report of every requirement side by side on one \"Requirements\" sheet of the .xlsx file, instead of a sheet for each requirement.")
+parser.add_argument('-w','--workers',type=int,default=1,
+                    help= "The number of processes to read the logfile with, each reads the devices in one part of it. Default: 1")
+parser.add_argument('--cache',action="store_true",
+                    help= "Keep the interpreted results of each logfile on disk, so running again on the same logfile loads them instead of interpreting it.")
+parser.add_argument('--cache-dir',type=str,default=None,
+                    help= f"With --cache, the directory to keep the results in. Default: {CACHE_DIRECTORY_HELP}")
+parser.add_argument('--cache-size',type=float,default=None,
+                    help= f"With --cache, the most MB to keep, the least recently used results are deleted first. Default: {CACHE_SIZE_MB_HELP}")
+parser.add_argument('--cache-by-hash',action="store_true",
+                    help= "With --cache, recognise a logfile by its contents (which must be read to hash them) instead of its path, size and modification time.")
+parser.add_argument('--follow',action="store_true",
+                    help= "Keep reading the logfile as the tester appends to it, printing each device as it finishes and rewriting the outputs as devices are added. Stop with Ctrl+C.")
+parser.add_argument('--poll-interval',type=float,default=1.0,
+                    help= "With --follow, seconds between checks for new devices. Default: 1")
+parser.add_argument('--update-interval',type=float,default=10.0,
+                    help= "With --follow, the least number of seconds between rewriting the outputs. Default: 10")
+parser.add_argument('--idle-timeout',type=float,default=None,
+                    help= "With --follow, stop once nothing has been appended to the logfile for this many seconds. Default: never stop")
+parser.add_argument('-j','--jobs',type=int,default=None,
+                    help= "With --batch, the number of logfiles to interpret at once. Default: the number of CPUs")
+parser.add_argument('--force',action="store_true",
+                    help= "With --batch, interpret every logfile, even if its outputs are already up to date.")
+parser.add_argument('--profile',action="store_true",
+                    help= "Print the time, throughput and peak memory of each stage (reading the logfile, each output and each part of it) once done.")
+parser.add_argument('--profile-output',type=str,default=None,
+                    help= "With --profile (which it turns on), also profile every function call with cProfile and write the statistics to this file.")
+parser.add_argument('--pipeline',action="store_true",
+                    help= "Read the logfile in a thread while it is parsed, and write each output format in its own process at the same time as the others.")
+parser.add_argument('--test-ids',type=str,nargs="+",default=None,
+                    help= "Only read the requirements with these test_ids (e.g. 2.1 3.1), the rows of every other requirement are skipped. Default: every requirement")
+parser.add_argument('--sites',type=int,nargs="+",default=None,
+                    help= "Only read the devices tested on these sites. Default: every site")
+parser.add_argument('--bins',type=int,nargs="+",default=None,
+                    help= "Only read the devices put in these bins. Default: every bin")
+device_result = parser.add_mutually_exclusive_group()
+device_result.add_argument('--only-passed',action="store_true",
+                    help= "Only read the devices that passed.")
+device_result.add_argument('--only-failed',action="store_true",
+                    help= "Only read the devices that failed.")
+parser.add_argument('--store',type=str,default=None,
+                    help= "A SQLite database of lots to add the --log or --batch logfiles to (instead of writing outputs), each logfile is only added once."+\
+                          f" Made if it does not exist, e.g. {STORE_PATH_HELP}")
+parser.add_argument('--trend',type=str,default=None,
+                    help= "With --store, print the statistics of this requirement (test_id) in each lot in the store, oldest first.")
+parser.add_argument('--site',type=int,default=None,
+                    help= "With --trend, only the devices tested on this site. Default: all sites")
+parser.add_argument('--last',type=int,default=None,
+                    help= "With --trend, only the most recent lots. Default: every lot")
+
+def run():
+    "Only run parser if directly called."
+    args = parser.parse_args()
+    if args.profile or args.profile_output is not None:
+        profiling.enable(args.profile_output)
+    try:
+        interpret(args)
+    finally:
+        profiler = profiling.disable()
+        if profiler is not None:
+            profiler.report()
+
+def interpret(args:argparse.Namespace):
+    "Does what the command line arguments ask for."
+    log_file = args.log
+    output_file = args.output if args.output is not None else DEFAULT_OUTPUT_NAME
+
+    if args.store is not None:
+        run_store(args)
+        return
+
+    if args.batch is not None:
+        run_batch(args)
+        return
+
+    if log_file is None:
+        raise ValueError("No logfile was provided")
+
+    if args.follow:
+        import src.logfile_following as following
+        following.follow_logfile(log_file,
+                                 on_update=lambda results: write_results(results=results,
+                                                                         output_name=output_file,
+                                                                         output_formats=args.formats,
+                                                                         writer_options=writer_options(args)),
+                                 poll_interval=args.poll_interval,
+                                 update_interval=args.update_interval,
+                                 idle_timeout=args.idle_timeout,
+                                 encoding=args.encoding,
+                                 encoding_errors=args.encoding_errors,
+                                 results_filter=results_filter_from_args(args))
+        return
+
+    if args.pipeline:
+        if args.workers > 1 or args.cache:
+            raise ValueError("--pipeline reads the logfile as it is parsed, it can not be used with --workers or --cache")
+        import src.pipeline as pipeline
+        results = pipeline.run_pipeline(log_file,
+                                        output_name=output_file,
+                                        output_formats=args.formats,
+                                        writer_options=writer_options(args),
+                                        encoding=args.encoding,
+                                        encoding_errors=args.encoding_errors,
+                                        results_filter=results_filter_from_args(args))
+        warn_unmatched_filter(args, results)
+        return
+
+    # Interpret the logfile once and share the results with every writer
+    cache = results_cache_from_args(args)
+    with profiling.stage("read logfile") as stage:
+        if cache is None:
+            results = lf.read_test_results(log_file,
+                                           encoding=args.encoding,
+                                           encoding_errors=args.encoding_errors,
+                                           workers=args.workers,
+                                           results_filter=results_filter_from_args(args))
+        else:
+            start = time.perf_counter()
+            results, cached = cache.read_test_results(log_file,
+                                                      encoding=args.encoding,
+                                                      encoding_errors=args.encoding_errors,
+                                                      workers=args.workers,
+                                                      results_filter=results_filter_from_args(args))
+            print(f"{'Loaded' if cached else 'Interpreted and cached'} the results of {log_file} in {time.perf_counter()-start:.2f}s")
+        stage.add(len(results.test_summaries), "devices")
+    warn_unmatched_filter(args, results)
+
+    write_results(results=results,
+                  output_name=output_file,
+                  output_formats=args.formats,
+                  writer_options=writer_options(args))
+
+def writer_options(args:argparse.Namespace) -> dict[str,dict]:
+    "The options of each output writer, from the command line arguments."
+    return {"xlsx": {"constant_memory": args.constant_memory, "combined_requirements": args.combined_requirements}}
+
+def results_filter_from_args(args:argparse.Namespace) -> lf.RESULTS_FILTER|None:
+    "Which results to read, None unless --test-ids, --sites, --bins, --only-passed or --only-failed was given."
+    results_filter = lf.RESULTS_FILTER(test_ids=frozenset(args.test_ids) if args.test_ids is not None else None,
+                                       site_nums=frozenset(args.sites) if args.sites is not None else None,
+                                       bin_nums=frozenset(args.bins) if args.bins is not None else None,
+                                       passed=True if args.only_passed else False if args.only_failed else None)
+    return results_filter if results_filter != lf.RESULTS_FILTER() else None
+
+def warn_unmatched_filter(args:argparse.Namespace, results:lf.TEST_RESULTS):
+    "Warns about the --test-ids that are not requirements in the logfile (as they are likely a typo), and when the filters kept no devices."
+    if args.test_ids is not None:
+        missing = [test_id for test_id in args.test_ids if test_id not in results.column_index]
+        if missing:
+            print(f"Warning: the logfile has no requirement with test_id {', '.join(missing)}", file=sys.stderr)
+    filtered = results_filter_from_args(args)
+    if filtered is not None and filtered.filters_devices and not results.test_summaries:
+        print("Warning: no devices in the logfile match --sites, --bins, --only-passed or --only-failed, the outputs only have the requirements", file=sys.stderr)
+
+def results_cache_from_args(args:argparse.Namespace) -> "results_cache.RESULTS_CACHE|None":
+    "The cache of interpreted results to use, None unless --cache was given."
+    if not args.cache:
+        return None
+    import src.results_cache as results_cache
+    return results_cache.RESULTS_CACHE(results_cache.DEFAULT_CACHE_DIRECTORY if args.cache_dir is None else args.cache_dir,
+                                       max_mb=results_cache.DEFAULT_CACHE_SIZE_MB if args.cache_size is None else args.cache_size,
+                                       by_hash=args.cache_by_hash)
+
+def run_store(args:argparse.Namespace):
+    "Adds the --log or --batch logfiles to the lot store, then prints the --trend of a requirement."
+    if args.log is None and args.batch is None and args.trend is None:
+        raise ValueError("--store needs logfiles to add (--log or --batch) or a requirement to print the trend of (--trend)")
+    if results_filter_from_args(args) is not None:
+        raise ValueError("--store keeps every result of each lot, it can not be used with --test-ids, --sites, --bins, --only-passed or --only-failed")
+
+    import src.lot_store as lot_store
+    with lot_store.LOT_STORE(args.store) as store:
+        if args.batch is not None:
+            import src.batch_processing as batch
+            logfiles = batch.find_logfiles(args.batch)
+            if not logfiles:
+                raise ValueError(f"No logfiles were found matching '{args.batch}'")
+            start = time.perf_counter()
+            outcomes = store.ingest_logfiles(logfiles,
+                                             encoding=args.encoding,
+                                             encoding_errors=args.encoding_errors,
+                                             jobs=args.jobs,
+                                             cache=results_cache_from_args(args))
+            added = sum(outcome == "added" for _, outcome in outcomes.values())
+            print(f"Added {added} of {len(logfiles)} logfiles to {args.store} in {time.perf_counter()-start:.2f}s")
+        elif args.log is not None:
+            start = time.perf_counter()
+            lot_id, added = store.ingest(args.log,
+                                         encoding=args.encoding,
+                                         encoding_errors=args.encoding_errors,
+                                         workers=args.workers,
+                                         cache=results_cache_from_args(args))
+            print(f"{'Added' if added else 'Already stored'} {args.log} as lot {lot_id} in {time.perf_counter()-start:.2f}s")
+
+        if args.trend is not None:
+            lot_store.print_trend(store.trend(args.trend, site_num=args.site, last=args.last))
+
+def run_batch(args:argparse.Namespace):
+    "Interprets every logfile matched by --batch, then prints how long each one took."
+    import src.batch_processing as batch
+    logfiles = batch.find_logfiles(args.batch)
+    if not logfiles:
+        raise ValueError(f"No logfiles were found matching '{args.batch}'")
+
+    start = time.perf_counter()
+    results = batch.run_batch(logfiles,
+                              output_formats=args.formats,
+                              output_dir=args.output,
+                              jobs=args.jobs,
+                              force=args.force,
+                              encoding=args.encoding,
+                              encoding_errors=args.encoding_errors,
+                              writer_options=writer_options(args),
+                              cache=results_cache_from_args(args),
+                              results_filter=results_filter_from_args(args))
+    batch.print_batch_summary(results, time.perf_counter()-start)
+
+    if any(result.status == "failed" for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
     run()
\ No newline at end of file
@@ -0,0 +1,195 @@
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import json
+import os
+import sys
+import time
+import src.logfile_reading as lf
+from src.results_cache import RESULTS_CACHE
+from src.output_writers import write_results
+
+# Remembers the hash of each logfile the outputs in a directory were generated from, by logfile name.
+# This lets a logfile that was copied or touched (newer mtime, same contents) be skipped without reading it again.
+BATCH_MANIFEST_NAME = ".interpret_log_manifest.json"
+
+@dataclass
+class BATCH_JOB:
+    logfile: str
+    output_name: str # Path of the outputs without their extension (e.g. out/lot1 -> out/lot1.csv, out/lot1.xlsx)
+    logfile_hash: str|None = None
+
+@dataclass
+class BATCH_RESULT:
+    logfile: str
+    status: str # "done", "skipped" or "failed"
+    seconds: float
+    device_count: int = 0
+    message: str = ""
+    logfile_hash: str|None = None # Of the logfile as it was interpreted, recorded in the manifest
+
+def find_logfiles(pattern:str) -> list[str]:
+    "Every .log file in a directory, or every file matching a glob pattern (e.g. 'lots/**/*.log'), sorted."
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.log")
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+def output_name_for(logfile:str, output_dir:str|None, logfile_root:str|None=None) -> str:
+    """Outputs are named after the logfile, next to it unless an output directory is given.
+        In the output directory, a logfile below logfile_root keeps its path relative to it (e.g. lots/x/lot.log, root lots -> <output_dir>/x/lot).
+    """
+    name = os.path.splitext(os.path.basename(logfile))[0]
+    if output_dir is None:
+        return os.path.join(os.path.dirname(logfile), name)
+    if logfile_root is None:
+        return os.path.join(output_dir, name)
+    return os.path.normpath(os.path.join(output_dir, os.path.relpath(os.path.dirname(os.path.abspath(logfile)), logfile_root), name))
+
+def output_names_for(logfiles:list[str], output_dir:str|None) -> dict[str,str]:
+    """The output name of each logfile (see output_name_for()), in an output directory relative to the directory all the logfiles are in,
+        so logfiles with the same name in different directories (e.g. from 'lots/**/*.log') don't write over each other's outputs.
+        Raises ValueError if two logfiles would still write the same outputs (e.g. lot.log and lot.txt).
+    """
+    logfile_root = None
+    if output_dir is not None and logfiles:
+        logfile_root = os.path.commonpath([os.path.dirname(os.path.abspath(logfile)) for logfile in logfiles])
+    output_names = {logfile: output_name_for(logfile, output_dir, logfile_root) for logfile in logfiles}
+
+    logfiles_by_output: dict[str,list[str]] = {}
+    for logfile, output_name in output_names.items():
+        logfiles_by_output.setdefault(os.path.normcase(os.path.abspath(output_name)), []).append(logfile)
+    collisions = [same_outputs for same_outputs in logfiles_by_output.values() if len(same_outputs) > 1]
+    if collisions:
+        raise ValueError("These logfiles would write the same outputs, rename them or interpret them separately: "
+                         + "; ".join(" and ".join(same_outputs) for same_outputs in collisions))
+    return output_names
+
+def load_manifest(directory:str) -> dict[str,dict]:
+    "The manifest of a directory of outputs, empty if there is none (or it can not be read)."
+    try:
+        with open(os.path.join(directory, BATCH_MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(directory:str, manifest:dict[str,dict]) -> None:
+    with open(os.path.join(directory, BATCH_MANIFEST_NAME), mode="w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+def filter_description(results_filter:lf.RESULTS_FILTER|None) -> dict|None:
+    "The results filter as it is recorded in the manifest, None when every result was kept."
+    if results_filter is None:
+        return None
+    return {name: sorted(value) if isinstance(value, frozenset) else value for name, value in asdict(results_filter).items()}
+
+def writer_options_description(output_formats:list[str], writer_options:dict[str,dict]|None) -> dict|None:
+    "The options each output format was written with as they are recorded in the manifest, only those that are on, None when none are."
+    description = {output_format: {name: value for name, value in sorted((writer_options or {}).get(output_format, {}).items()) if value}
+                   for output_format in sorted(output_formats)}
+    return {output_format: options for output_format, options in description.items() if options} or None
+
+def outputs_up_to_date(job:BATCH_JOB, output_formats:list[str], manifest:dict[str,dict], results_filter:lf.RESULTS_FILTER|None=None,
+                       writer_options:dict[str,dict]|None=None) -> bool:
+    """True if every output of the job already exists and was generated from the current logfile.
+        |-> Outputs newer than the logfile are up to date.
+        |-> Otherwise, they are up to date if the manifest has the same hash for the logfile (this hashes the logfile into job.logfile_hash).
+        |-> Either way, not if the manifest records they were generated with another results filter, or other options for one of the output formats.
+    """
+    output_paths = [f"{job.output_name}.{output_format}" for output_format in output_formats]
+    if not all(os.path.exists(path) for path in output_paths):
+        return False
+
+    entry = manifest.get(os.path.basename(job.output_name))
+    if (entry or {}).get("filter") != filter_description(results_filter):
+        return False
+    recorded_options = {output_format: options for output_format, options in ((entry or {}).get("writer_options") or {}).items()
+                        if output_format in output_formats}
+    if (recorded_options or None) != writer_options_description(output_formats, writer_options):
+        return False
+
+    if min(os.path.getmtime(path) for path in output_paths) >= os.path.getmtime(job.logfile):
+        return True
+
+    if entry is None or not set(output_formats) <= set(entry.get("formats", [])):
+        return False
+    job.logfile_hash = lf.hash_logfile(job.logfile)
+    return entry.get("sha256") == job.logfile_hash
+
+def process_logfile(job:BATCH_JOB, output_formats:list[str], encoding:str=lf.LOGFILE_ENCODING,
+                    encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS, writer_options:dict[str,dict]|None=None,
+                    cache:RESULTS_CACHE|None=None, results_filter:lf.RESULTS_FILTER|None=None) -> BATCH_RESULT:
+    """Interprets one logfile (or loads it from the cache) and writes its outputs, this runs in the worker processes of run_batch().
+        The logfile is hashed before it is interpreted, so if it is appended to meanwhile the manifest doesn't record the new contents as done.
+    """
+    start = time.perf_counter()
+    cached = False
+    try:
+        logfile_hash = job.logfile_hash or lf.hash_logfile(job.logfile)
+        if cache is None:
+            results = lf.read_test_results(job.logfile, encoding=encoding, encoding_errors=encoding_errors, results_filter=results_filter)
+        else:
+            results, cached = cache.read_test_results(job.logfile, encoding=encoding, encoding_errors=encoding_errors, results_filter=results_filter)
+        write_results(results=results, output_name=job.output_name, output_formats=output_formats, writer_options=writer_options)
+    except Exception as e:
+        return BATCH_RESULT(job.logfile, "failed", time.perf_counter()-start, message=f"{type(e).__name__}: {e}")
+    return BATCH_RESULT(job.logfile, "done", time.perf_counter()-start, device_count=len(results.test_summaries),
+                        message="results from cache" if cached else "", logfile_hash=logfile_hash)
+
+def run_batch(logfiles:list[str], output_formats:list[str], output_dir:str|None=None, jobs:int|None=None, force:bool=False,
+              encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS,
+              writer_options:dict[str,dict]|None=None, cache:RESULTS_CACHE|None=None,
+              results_filter:lf.RESULTS_FILTER|None=None) -> list[BATCH_RESULT]:
+    """Interprets every logfile in a pool of jobs worker processes (default: one per CPU), in a single interpreter.
+        Logfiles whose outputs are already up to date are skipped (see outputs_up_to_date()), unless force is set.
+        Only the results kept by results_filter are written, outputs written with another filter are not up to date.
+        Returns a BATCH_RESULT for each logfile, in the order given.
+    """
+    jobs_by_logfile = {logfile: BATCH_JOB(logfile, output_name) for logfile, output_name in output_names_for(logfiles, output_dir).items()}
+    manifests = {directory: load_manifest(directory) for directory in {os.path.dirname(job.output_name) for job in jobs_by_logfile.values()}}
+    if output_dir is not None:
+        for directory in manifests:
+            os.makedirs(directory, exist_ok=True)
+
+    results: dict[str,BATCH_RESULT] = {}
+    pending: list[BATCH_JOB] = []
+    for logfile, job in jobs_by_logfile.items():
+        start = time.perf_counter()
+        if not force and outputs_up_to_date(job, output_formats, manifests[os.path.dirname(job.output_name)], results_filter, writer_options):
+            results[logfile] = BATCH_RESULT(logfile, "skipped", time.perf_counter()-start, message="outputs up to date")
+        else:
+            pending.append(job)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count() or 1, len(pending))) as pool:
+            futures = [pool.submit(process_logfile, job, output_formats, encoding, encoding_errors, writer_options, cache, results_filter) for job in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.logfile] = result
+                print(f"{result.status:>7} {result.seconds:8.2f}s  {result.logfile}", file=sys.stderr)
+
+    # Remember what each output was generated from
+    for job in pending:
+        result = results[job.logfile]
+        if result.status == "done":
+            manifests[os.path.dirname(job.output_name)][os.path.basename(job.output_name)] = {
+                "sha256": result.logfile_hash,
+                "formats": sorted(output_formats),
+                "filter": filter_description(results_filter),
+                "writer_options": writer_options_description(output_formats, writer_options)}
+    for directory, manifest in manifests.items():
+        if any(os.path.dirname(job.output_name) == directory for job in pending):
+            save_manifest(directory, manifest)
+
+    return [results[logfile] for logfile in logfiles]
+
+def print_batch_summary(results:list[BATCH_RESULT], wall_seconds:float, file=sys.stdout) -> None:
+    "Prints the time taken for each logfile, then the totals."
+    name_width = max([len(r.logfile) for r in results] + [len("Logfile")])
+    print(f"{'Logfile':<{name_width}}  {'Status':<7}  {'Devices':>8}  {'Seconds':>8}", file=file)
+    for r in results:
+        print(f"{r.logfile:<{name_width}}  {r.status:<7}  {r.device_count if r.status == 'done' else '':>8}  {r.seconds:8.2f}"
+              + (f"  {r.message}" if r.message and r.status != "skipped" else ""), file=file)
+
+    counts = {status: sum(r.status == status for r in results) for status in ("done","skipped","failed")}
+    print(f"{len(results)} logfiles: {counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed. "
+          f"{sum(r.seconds for r in results):.2f}s of work in {wall_seconds:.2f}s", file=file)
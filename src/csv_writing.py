@@ -0,0 +1,86 @@
+import csv
+import sys
+import math
+import src.logfile_reading as lf
+
+def results_to_csv(results: lf.TEST_RESULTS, targetfile: str) -> None:
+    "This takes the interpreted logfile results and generates a csv outpu in the target file."
+
+    test_config_rows, test_summaries = results.config_rows, results.test_summaries
+    values, passed, present = results.values, results.passed, results.present
+
+    # CSV FORMAT
+    # |               CONFIG INFO                |           Test 1          |
+    # |                                          |    Site 1   |    Site 2   |   ...
+    # | TEST_NUM | Test_Name | Min | Max | Units | Value | P/F | Value | P/F |
+    #        ...
+    # | Overall  |           |     |     |       | result| P/F | result| P/F |
+
+    # Config # rows = 5,   Test # rows = 4,  # Columns = # tests + 4
+
+    # Write results to new csv file
+    site_test_count = results.site_test_count # each site counts as one test
+    test_nums = results.test_nums.tolist() # The test each device was in, a device filter can leave some sites out of a test
+
+    testcase_rows = results.requirement_count
+
+    try:
+        with open(targetfile, mode="w",newline="\n") as csvfile:
+            csvwriter = csv.writer(csvfile, delimiter=',',quotechar='"', quoting=csv.QUOTE_MINIMAL)
+
+            # Make Top Level Headers
+            row =  "Config Information,,,,".split(",")
+            for i, test_num in enumerate(test_nums):
+                row += [f"Test #{test_num+1}" if i == 0 or test_num != test_nums[i-1] else '','']
+            csvwriter.writerow(row)
+
+            # Make Second Level Headers
+            row = ",,,,".split(",")
+            for i in range(site_test_count):
+                    row += f"Site {test_summaries[i].site_num},".split(",")
+            csvwriter.writerow(row)
+
+            # Make Third Level Headers
+            row = "#,Name,Max,Min,Unit".split(",")
+            for _ in range(site_test_count):
+                row += "Value,?".split(",")
+            csvwriter.writerow(row)
+
+            # Write rows for all data rows
+            for r in range(testcase_rows):
+                cfg:lf.TEST_DATA_CONFIG = test_config_rows[r]
+                row = [cfg.test_id,
+                    cfg.name,
+                    cfg.min if not None else '',
+                    cfg.max if not None else '',
+                    cfg.unit]
+                for value, data_passed, data_present in zip(values[:,r].tolist(), passed[:,r].tolist(), present[:,r].tolist()):
+                    row += [value,lf.passed_to_pass_fail(data_passed)] if data_present else ['',''] # Not tested
+                csvwriter.writerow(row)
+
+            # Write Final summary Row
+            row = "Overall,,,,".split(",")
+            for i in range(site_test_count):
+                row += ['',lf.passed_to_pass_fail(test_summaries[i].passed)]
+            csvwriter.writerow(row)
+
+    except PermissionError as e:
+        raise type(e)(str(e) + f"You may have this file open in another program.'").with_traceback(sys.exc_info()[2])
+                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
+
+def statistics_to_csv(results: lf.TEST_RESULTS, targetfile: str) -> None:
+    "Writes the statistics of each requirement (see requirement_statistics.py), for all sites and each site, to the target file."
+    import src.requirement_statistics as stats # Only when the statistics are written, not for every .csv of the results
+    statistics = stats.compute_requirement_statistics(results)
+
+    try:
+        with open(targetfile, mode="w",newline="\n") as csvfile:
+            csvwriter = csv.writer(csvfile, delimiter=',',quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csvwriter.writerow(stats.STATISTICS_HEADERS)
+            for row in statistics.rows():
+                # Leave statistics that can't be calculated (e.g. Cp without both limits) empty
+                csvwriter.writerow(['' if isinstance(value, float) and not math.isfinite(value) else value for value in row])
+
+    except PermissionError as e:
+        raise type(e)(str(e) + f"You may have this file open in another program.'").with_traceback(sys.exc_info()[2])
+                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
@@ -1,23 +1,335 @@
 import toml
+import os
 import sys
-from xlsxwriter.workbook import Workbook, Format
+from functools import lru_cache
+from xlsxwriter.workbook import Workbook, Worksheet, Format
+from xlsxwriter.utility import xl_pixel_width
+import xlsxwriter.exceptions as xlsx_exceptions
+import math
+import numpy as np
+import src.logfile_reading as lf
+import src.requirement_statistics as stats
+import src.profiling as profiling
 
-CONFIG_FILEPATH = "./config.toml"
+# Next to this repository's pyproject.toml, wherever the program is run from
+CONFIG_FILEPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.toml")
 
-config_data = toml.load(CONFIG_FILEPATH)
+# Widest a column is sized to in pixels, and the padding added to its widest value (the same as Worksheet.autofit())
+MAX_COLUMN_PIXELS = 1790
+COLUMN_PADDING_PIXELS = 7
 
-# Make variables that can be called in code to get formatting info
-formats = config_data["format"]
+# A requirement report is its config info (5 columns), an empty column, then the test and site, P/F and value of each device (3 columns)
+REQUIREMENT_REPORT_COLUMNS = 9
 
-conditional_formats = config_data["format"]["conditional"]
+# Sheet the requirement reports are put side by side on (an empty column between each) with combined_requirements, instead of a sheet each
+COMBINED_REQUIREMENTS_SHEET = "Requirements"
+
+# P/F marker of a result, indexed by whether it passed
+MARKERS = ("F", "P")
+
+@lru_cache(maxsize=None)
+def load_config(config_filepath:str=CONFIG_FILEPATH)->dict:
+    "The parsed config file, read the first time a workbook needs it and kept for every workbook after it (e.g. in --batch or --follow)."
+    return toml.load(config_filepath)
 
 def format_from_config(wb:Workbook, config_format_name=str)->Format:
     "returns a formatting object following the specification in config.toml (e.g. config: [format.pass] -> config_format_name='pass')"
     try:
-        return wb.add_format(formats[config_format_name])
+        return wb.add_format(load_config()["format"][config_format_name])
     except KeyError as e:
         raise type(e)(str(e) + f"\nCould not find [format.{config_format_name}] in the config file ({CONFIG_FILEPATH})").with_traceback(sys.exc_info()[2])
                     #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
 
 def conditional_format_from_config(wb:Workbook,config_format_name=str)->Format:
-    raise NotImplementedError()
\ No newline at end of file
+    raise NotImplementedError()
+
+class FORMAT_REGISTRY:
+    """The formats of one workbook, each added from config.toml the first time it is asked for and the same Format object every time after.
+        e.g. formats = FORMAT_REGISTRY(wb); formats["pass"]  ->  the Format of [format.pass]
+        A workbook only holds the formats its cells use, and formats that are picked per cell are looked up once, before the cells are written.
+    """
+    def __init__(self, wb:Workbook):
+        self.wb = wb
+        self.formats: dict[str,Format] = {}
+
+    def __getitem__(self, config_format_name:str)->Format:
+        cell_format = self.formats.get(config_format_name)
+        if cell_format is None:
+            cell_format = self.formats[config_format_name] = format_from_config(self.wb, config_format_name)
+        return cell_format
+
+    def by_passed(self, fail_format_name:str, pass_format_name:str)->tuple[Format,Format]:
+        "The fail and pass formats as a tuple, to pick a result's format by indexing it with whether the result passed."
+        return (self[fail_format_name], self[pass_format_name])
+
+def cell_width(value:str|float|int)->int:
+    "The width of a cell's value in pixels, worked out the same way as Worksheet.autofit() (which is not supported in constant_memory mode)."
+    if isinstance(value, str):
+        return max(xl_pixel_width(line) for line in value.split("\n"))
+    return 7 * len(str(value))
+
+def value_widths(values:np.ndarray, present:np.ndarray)->np.ndarray:
+    "cell_width() of every value at once (as they are written, str() of the float), 0 where the measurement is not in the logfile."
+    return np.where(present, 7*np.char.str_len(values.astype(str)), 0)
+
+def marker_widths(passed:np.ndarray, present:np.ndarray)->np.ndarray:
+    "cell_width() of the P/F marker of every result at once, 0 where the measurement is not in the logfile."
+    return np.where(present, np.where(passed, cell_width(MARKERS[True]), cell_width(MARKERS[False])), 0)
+
+class SHEET_WRITER:
+    """Writes one worksheet, keeping the width of the widest value in each column so the columns can be sized without scanning
+        every cell again (Worksheet.autofit()), and counting the cells written for the throughput of --profile.
+        Cells written from whole columns of the results go straight to the worksheet, their widths are worked out from the arrays with widen().
+    """
+    def __init__(self, ws:Worksheet):
+        self.ws = ws
+        self.widths: dict[int,int] = {}
+        self.cell_count = 0
+
+    def widen(self, column:int, pixel_width:int)->None:
+        "Makes the column at least pixel_width wide."
+        if pixel_width > self.widths.get(column, 0):
+            self.widths[column] = pixel_width
+
+    def write(self, row:int, column:int, value:str|float, cell_format:Format|None=None)->None:
+        "Writes one cell."
+        self.ws.write(row, column, value, cell_format)
+        self.widen(column, cell_width(value))
+        self.cell_count += 1
+
+    def write_empty(self, row:int, column:int, cell_format:Format)->None:
+        "Writes a cell with only a format."
+        self.ws.write_blank(row, column, None, cell_format)
+        self.cell_count += 1
+
+    def merge(self, first_row:int, first_column:int, last_row:int, last_column:int, value:str, cell_format:Format)->None:
+        "Writes merged cells, their value counts towards the width of the first column like in autofit()."
+        self.ws.merge_range(first_row, first_column, last_row, last_column, value, cell_format)
+        self.widen(first_column, cell_width(value))
+        self.cell_count += 1
+
+    def fit_columns(self)->None:
+        "Sizes the columns to their widest value, with the padding and limit of autofit()."
+        for column, pixel_width in self.widths.items():
+            if pixel_width > 0:
+                self.ws.set_column_pixels(column, column, min(pixel_width + COLUMN_PADDING_PIXELS, MAX_COLUMN_PIXELS))
+
+def create_requirement_info(sheet:SHEET_WRITER, formats:FORMAT_REGISTRY, requirement:lf.TEST_DATA_CONFIG, row:int, first_column:int)->None:
+    "Writes the 5 cells of config info of one requirement (ID, Test Name, Max, Min, Units)."
+    sheet.write(row,first_column  ,requirement.test_id)
+    sheet.write(row,first_column+1,requirement.name)
+    if requirement.min is not None:
+        sheet.write(row,first_column+2,requirement.min)
+    else:
+        sheet.write_empty(row,first_column+2,formats["empty"])
+    if requirement.max is not None:
+        sheet.write(row,first_column+3,requirement.max)
+    else:
+        sheet.write_empty(row,first_column+3,formats["empty"])
+    sheet.write(row,first_column+4,requirement.unit)
+
+def create_overall_results(sheet:SHEET_WRITER, formats:FORMAT_REGISTRY, results:lf.TEST_RESULTS, passed:np.ndarray, present:np.ndarray,
+                           results_value_widths:np.ndarray, results_marker_widths:np.ndarray, first_column:int)->None:
+    """Writes the config info (5 columns) followed by every test (2 columns for each site) as specified in the 'CSV Format' comment in results_to_excel().
+        Each site of a test is 2 columns (its values and their P/F markers), the rows are written in order from the top.
+        passed and present are results.passed and results.present, unpacked once by the caller.
+        Measurements that are not in the logfile are left empty.
+    """
+    SITE_NUM_COLUMNS = 2
+    TESTS_COLUMN = first_column + 5
+
+    test_summaries, test_nums = results.test_summaries, results.test_nums.tolist()
+    f_title, f_empty = formats["title"], formats["empty"]
+    f_datapoints = formats.by_passed("subtle_fail", "none")
+    f_markers = formats.by_passed("fail", "pass")
+
+    device_count = len(test_summaries)
+    site_columns = [TESTS_COLUMN + device*SITE_NUM_COLUMNS for device in range(device_count)]
+
+    # Test headers over the sites of each test (a device filter can leave some out), the config info header is merged down into the next row so goes last
+    test_starts = [device for device in range(device_count) if device == 0 or test_nums[device] != test_nums[device-1]]
+    for start, end in zip(test_starts, test_starts[1:] + [device_count]):
+        sheet.merge(0,site_columns[start],0,site_columns[end-1]+SITE_NUM_COLUMNS-1,f"TEST #{test_nums[start]+1}",f_title)
+    sheet.merge(0,first_column,1,first_column+4,"CONFIG INFO",f_title)
+
+    # Site headers
+    for device, column in enumerate(site_columns):
+        sheet.merge(1,column,1,column+1,f"Site {test_summaries[device].site_num}",f_title)
+
+    # Column headers
+    for column, header in enumerate(["ID","Test Name", "Max", "Min", "Units"], start=first_column):
+        sheet.write(2,column,header,f_title)
+    for column in site_columns:
+        sheet.write(2,column,"Value",f_title)
+        sheet.write(2,column+1,"?",f_title)
+
+    # One row for each requirement, written from its column of the results with the formats picked by whether each result passed
+    write_number, write_string, write_blank = sheet.ws.write_number, sheet.ws.write_string, sheet.ws.write_blank
+    for r, requirement in enumerate(results.config_rows):
+        row = 3 + r
+        create_requirement_info(sheet,formats,requirement,row,first_column)
+        for column, value, requirement_passed, requirement_present in zip(site_columns, results.values[:,r].tolist(),
+                                                                          passed[:,r].tolist(), present[:,r].tolist()):
+            if requirement_present:
+                write_number(row,column,value,f_datapoints[requirement_passed])
+                write_string(row,column+1,MARKERS[requirement_passed],f_markers[requirement_passed])
+            else:
+                write_blank(row,column,None,f_empty)
+                write_blank(row,column+1,None,f_empty)
+    sheet.cell_count += 2*device_count*results.requirement_count
+
+    # Each device's columns are as wide as its widest value and marker
+    for column, value_width, marker_width in zip(site_columns, results_value_widths.max(axis=1, initial=0).tolist(),
+                                                 results_marker_widths.max(axis=1, initial=0).tolist()):
+        sheet.widen(column, value_width)
+        sheet.widen(column+1, marker_width)
+
+    # Overall results of each site
+    row = 3 + results.requirement_count
+    sheet.merge(row,first_column,row,first_column+4,"Overall Results:",f_title)
+    for device, column in enumerate(site_columns):
+        test_summary = test_summaries[device]
+        sheet.merge(row,column,row,column+1,MARKERS[test_summary.passed],f_markers[test_summary.passed])
+
+def create_requirement_reports(sheet:SHEET_WRITER, formats:FORMAT_REGISTRY, results:lf.TEST_RESULTS, passed:np.ndarray, present:np.ndarray,
+                               requirements:list[int], first_columns:list[int], device_labels:list[str],
+                               results_value_widths:np.ndarray, results_marker_widths:np.ndarray)->None:
+    """Writes the report of each requirement (by its column in the results) from its first column: its config info,
+        then a row for each device's result of it (its test and site, P/F and value) from the top.
+        The reports are written a row at a time across all of them, so several can share a sheet in constant_memory mode.
+        The P/F and value are left empty for devices it is not in the logfile for.
+        passed and present are results.passed and results.present, unpacked once by the caller.
+    """
+    f_title, f_empty = formats["title"], formats["empty"]
+    f_datapoints = formats.by_passed("subtle_fail", "subtle_pass")
+    f_markers = formats.by_passed("fail", "pass")
+
+    def create_headers()->None:
+        for first_column in first_columns:
+            for header_column, header in enumerate(["ID","Test Name", "Min", "Max", "Units"], start=first_column):
+                sheet.write(0,header_column,header,f_title)
+
+    def create_infos()->None:
+        for r, first_column in zip(requirements, first_columns):
+            create_requirement_info(sheet,formats,results.config_rows[r],1,first_column)
+
+    # skip a column and write out results in the following columns, from the first row
+    reports = [(first_column+6, results.values[:,r].tolist(), passed[:,r].tolist(), present[:,r].tolist())
+               for r, first_column in zip(requirements, first_columns)]
+    write_number, write_string, write_blank = sheet.ws.write_number, sheet.ws.write_string, sheet.ws.write_blank
+    for i, label in enumerate(device_labels):
+        if i == 0:
+            create_headers()
+        elif i == 1:
+            create_infos()
+
+        for column, requirement_values, requirement_passed, requirement_present in reports:
+            if requirement_present[i]:
+                data_passed = requirement_passed[i]
+                write_string(i,column,label,f_datapoints[data_passed])
+                write_string(i,column+1,MARKERS[data_passed],f_markers[data_passed])
+                write_number(i,column+2,requirement_values[i],f_datapoints[data_passed])
+            else:
+                write_string(i,column,label,f_empty)
+                write_blank(i,column+1,None,f_empty)
+                write_blank(i,column+2,None,f_empty)
+    sheet.cell_count += 3*len(device_labels)*len(reports)
+
+    # Not reached when there are less than two devices
+    if len(device_labels) < 1:
+        create_headers()
+    if len(device_labels) < 2:
+        create_infos()
+
+    label_width = max(map(cell_width, device_labels), default=0)
+    for r, (column, *_) in zip(requirements, reports):
+        sheet.widen(column, label_width)
+        sheet.widen(column+1, int(results_marker_widths[:,r].max(initial=0)))
+        sheet.widen(column+2, int(results_value_widths[:,r].max(initial=0)))
+
+def create_statistics_report(sheet:SHEET_WRITER, formats:FORMAT_REGISTRY, requirement_statistics:stats.REQUIREMENT_STATISTICS, first_row:int, first_column:int)->None:
+    "Writes a row of statistics for each requirement of each group of sites (see requirement_statistics.py), statistics that can't be calculated are left empty."
+    f_title = formats["title"]
+    for column, header in enumerate(stats.STATISTICS_HEADERS, start=first_column):
+        sheet.write(first_row,column,header,f_title)
+    for row, statistics_row in enumerate(requirement_statistics.rows(), start=first_row+1):
+        for column, value in enumerate(statistics_row, start=first_column):
+            if not (isinstance(value, float) and not math.isfinite(value)):
+                sheet.write(row,column,value)
+
+def results_to_excel(results:lf.TEST_RESULTS, targetfile:str, constant_memory:bool=False, statistics:bool=True, combined_requirements:bool=False)->None:
+    """Creates an excel file from the interpreted logfile results, with a "Statistics" sheet of each requirement's statistics unless statistics is False.
+        Each requirement's report is on a sheet of its own, or with combined_requirements side by side on one "Requirements" sheet.
+        Every worksheet is written in row order, so with constant_memory each row is written out to disk as soon as the next one starts
+        (see https://xlsxwriter.readthedocs.io/working_with_memory.html), instead of holding every cell until the file is closed.
+        This keeps memory flat as the number of devices grows, but strings are not shared between cells.
+        Columns are sized from the widths of the values as they are written (worked out from whole arrays for the results), rather than with autofit().
+    """
+    # CSV FORMAT
+
+    # |               CONFIG INFO                |           Test 1          |
+    # |                                          |    Site 1   |    Site 2   |   ...
+    # | TEST_NUM | Test_Name | Min | Max | Units | Value | P/F | Value | P/F |
+    #        ...
+    # | Overall  |           |     |     |       | result| P/F | result| P/F |
+
+    # Config # rows = 5,   Test # rows = 2 for each site,  # Columns = # tests + 4
+
+    test_config_rows, test_summaries = results.config_rows, results.test_summaries
+    passed, present = results.passed, results.present # Unpacked once here, each access of the properties unpacks the whole array
+
+    requirement_count = results.requirement_count # Each of the things that will be tested.
+
+    try:
+        wb = Workbook(targetfile, {"constant_memory": constant_memory})
+        cell_count = 0
+        try:
+            all_results = SHEET_WRITER(wb.add_worksheet(name="Overall Results"))
+            formats = FORMAT_REGISTRY(wb)
+
+            # Worked out once for every sheet the results are on
+            with profiling.stage("column widths") as stage:
+                results_value_widths = value_widths(results.values, present)
+                results_marker_widths = marker_widths(passed, present)
+                device_labels = [f"T{test_num+1}-S{(summary.site_num)}" for test_num, summary in zip(results.test_nums.tolist(), test_summaries)]
+                stage.add(results.values.size, "cells")
+
+            # Create main results file
+            with profiling.stage("overall results") as stage:
+                create_overall_results(all_results,formats,results,passed,present,results_value_widths,results_marker_widths,0)
+                all_results.fit_columns()
+                stage.add(all_results.cell_count, "cells")
+            cell_count += all_results.cell_count
+
+            if statistics:
+                statistics_sheet = SHEET_WRITER(wb.add_worksheet(name="Statistics"))
+                with profiling.stage("statistics") as stage:
+                    create_statistics_report(statistics_sheet,formats,stats.compute_requirement_statistics(results),0,0)
+                    statistics_sheet.fit_columns()
+                    stage.add(statistics_sheet.cell_count, "cells")
+                cell_count += statistics_sheet.cell_count
+
+            # Create results file for each requirement, or one with all of them
+            if combined_requirements:
+                report_sheets = [(COMBINED_REQUIREMENTS_SHEET, list(range(requirement_count)))]
+            else:
+                report_sheets = [(f"{test_config_rows[r].test_id}-{test_config_rows[r].name}", [r]) for r in range(requirement_count)]
+            for sheet_name, requirements in report_sheets:
+                req_results = SHEET_WRITER(wb.add_worksheet(name=sheet_name))
+                with profiling.stage("requirement sheets") as stage:
+                    create_requirement_reports(req_results,formats,results,passed,present,requirements,
+                                               first_columns=[i*(REQUIREMENT_REPORT_COLUMNS+1) for i in range(len(requirements))],
+                                               device_labels=device_labels,
+                                               results_value_widths=results_value_widths,
+                                               results_marker_widths=results_marker_widths)
+                    req_results.fit_columns()
+                    stage.add(req_results.cell_count, "cells")
+                cell_count += req_results.cell_count
+        finally:
+            with profiling.stage("save workbook") as stage: # Where the cells held in memory are written out, unless constant_memory
+                wb.close()
+                stage.add(cell_count, "cells")
+
+    except (PermissionError,xlsx_exceptions.FileCreateError) as e:
+        raise type(e)(str(e) + f" You may have this file open in another program.'").with_traceback(sys.exc_info()[2])
+                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
@@ -0,0 +1,152 @@
+from collections import Counter
+import os
+import time
+from typing import Callable
+import src.logfile_reading as lf
+
+# Bytes read from the logfile at a time while following it
+FOLLOW_READ_SIZE = 1 << 22
+
+def end_of_complete_devices(data:bytes) -> int:
+    "Index just after the last complete TEST_SUMMARY row in data (which starts at the start of a row), 0 if there is none."
+    search_end = len(data)
+    while True:
+        summary_row = data.rfind(b"\n130,", 0, search_end) + 1
+        if summary_row == 0 and not data.startswith(b"130,"):
+            return 0
+        end = lf.end_of_row(data, summary_row)
+        if end >= 0:
+            return end
+        if summary_row == 0:
+            return 0
+        search_end = summary_row # The tester is still writing this row, try the one before it
+
+class LOGFILE_FOLLOWER:
+    """Interprets a logfile while the tester is still appending to it, one complete device (up to its TEST_SUMMARY row) at a time.
+        Every byte of the logfile is read once: the rows of complete devices are added to a TEST_RESULTS_BUILDER,
+        and only the rows of the device the tester is still writing are held until the rest of it is appended.
+        If the logfile is truncated or replaced (e.g. a new lot), it starts over from the beginning of the new logfile.
+    """
+    def __init__(self, logfile:str, encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS,
+                 results_filter:lf.RESULTS_FILTER|None=None):
+        self.logfile = logfile
+        self.encoding = encoding
+        self.encoding_errors = encoding_errors
+        self.results_filter = results_filter
+        self.file = None
+        self.restarts = 0 # Times the logfile was truncated or replaced
+        self._restart()
+
+    def _restart(self) -> None:
+        "Starts over from the beginning of the logfile."
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.logfile, mode="rb")
+        self.offset = 0 # Bytes of the logfile read so far
+        self.pending = b"" # Rows of the device still being written
+        self.builder = lf.TEST_RESULTS_BUILDER(self.logfile, self.encoding, self.encoding_errors, results_filter=self.results_filter)
+
+    def _replaced(self) -> bool:
+        "True if the logfile was truncated, or replaced by a new file at the same path."
+        try:
+            path_stat = os.stat(self.logfile)
+        except FileNotFoundError:
+            return False # Being replaced, keep following the old one until the new one appears
+        file_stat = os.fstat(self.file.fileno())
+        return (path_stat.st_ino, path_stat.st_dev) != (file_stat.st_ino, file_stat.st_dev) or file_stat.st_size < self.offset
+
+    def poll(self) -> list[lf.TEST_SUMMARY]:
+        "Reads what has been appended to the logfile since the last poll, returns the TEST_SUMMARY of each device it completed."
+        restarted = self._replaced()
+        if restarted:
+            self._restart()
+            self.restarts += 1
+
+        device_count = len(self.builder.test_summaries)
+        while chunk := self.file.read(FOLLOW_READ_SIZE):
+            self.offset += len(chunk)
+            data = self.pending + chunk
+            end = end_of_complete_devices(data)
+            if end:
+                self.builder.add_data(data, 0, end)
+            self.pending = data[end:]
+        return self.builder.test_summaries[0 if restarted else device_count:]
+
+    def finish(self, complete:bool=True) -> lf.TEST_RESULTS:
+        """Adds the rows left after the last device (e.g. the end of lot rows), and closes the logfile.
+            If the tester may still be writing (complete is False), a last row without a line break is left out.
+        """
+        self.poll()
+        end = len(self.pending) if complete else self.pending.rfind(b"\n") + 1
+        if end:
+            self.builder.add_data(self.pending, 0, end)
+        self.pending = self.pending[end:]
+        self.file.close()
+        return self.builder.results()
+
+    def results(self) -> lf.TEST_RESULTS:
+        "The TEST_RESULTS of every device completed so far."
+        return self.builder.results()
+
+class RUNNING_YIELD:
+    "Counts of the devices tested and passed, overall and by site, updated one device at a time."
+    def __init__(self):
+        self.tested: Counter[int] = Counter()
+        self.passed: Counter[int] = Counter()
+
+    def add(self, summary:lf.TEST_SUMMARY) -> None:
+        self.tested[summary.site_num] += 1
+        self.passed[summary.site_num] += summary.passed
+
+    def __str__(self) -> str:
+        total_tested, total_passed = sum(self.tested.values()), sum(self.passed.values())
+        sites = ", ".join(f"site {site} {self.passed[site]}/{self.tested[site]}" for site in sorted(self.tested))
+        return f"yield {total_passed}/{total_tested} ({100*total_passed/total_tested if total_tested else 0:.1f}%): {sites}"
+
+def follow_logfile(logfile:str, on_update:Callable[[lf.TEST_RESULTS],None], poll_interval:float=1.0, update_interval:float=10.0,
+                   idle_timeout:float|None=None, encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS,
+                   results_filter:lf.RESULTS_FILTER|None=None) -> lf.TEST_RESULTS:
+    """Follows a logfile until nothing is appended to it for idle_timeout seconds (or forever, until interrupted with Ctrl+C).
+        |-> Each device is printed with the running yield as soon as its TEST_SUMMARY row is written.
+        |-> on_update is called with the results so far (e.g. to rewrite the outputs) at most once every update_interval seconds,
+            and once more with the final results when following stops, unless no device was completed (so the outputs are never written without devices).
+        |-> With a results_filter, only the devices it keeps are printed and counted in the running yield.
+    """
+    follower = LOGFILE_FOLLOWER(logfile, encoding, encoding_errors, results_filter)
+    running_yield = RUNNING_YIELD()
+    last_update = last_growth = time.monotonic()
+    updated = True # Nothing to update until a device is added
+    complete = False # Only once the logfile has stopped growing
+    try:
+        while True:
+            offset, restarts = follower.offset, follower.restarts
+            new_summaries = follower.poll()
+            now = time.monotonic()
+            if follower.restarts != restarts:
+                print(f"{logfile} was truncated or replaced, starting over")
+                running_yield = RUNNING_YIELD()
+            if follower.offset != offset:
+                last_growth = now
+            if new_summaries:
+                for summary in new_summaries:
+                    running_yield.add(summary)
+                    print(f"Device {summary.serial_num} site {summary.site_num}: {lf.passed_to_pass_fail(summary.passed)} bin {summary.bin_num}, {running_yield}")
+                updated = False
+
+            if not updated and now - last_update >= update_interval:
+                on_update(follower.results())
+                last_update, updated = now, True
+
+            if idle_timeout is not None and now - last_growth >= idle_timeout:
+                complete = True
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+    results = follower.finish(complete)
+    if results.test_summaries:
+        on_update(results)
+    else:
+        print(f"No device was completed in {logfile}, so no outputs were written")
+    return results
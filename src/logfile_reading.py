@@ -1,8 +1,19 @@
 from enum import Enum
 from dataclasses import dataclass
-from typing import Any, Protocol, Generator, Iterator
+from functools import cached_property
+from typing import Any, Protocol, Generator, Iterator, Callable
+from array import array
+from contextlib import contextmanager
+from itertools import repeat
+from operator import itemgetter
 import csv 
 import sys
+import hashlib
+import io
+import os
+import mmap
+import numpy as np
+import src.profiling as profiling
 
 class Row_Types(Enum):
     TEST_DATA_CONFIG    = 10
@@ -14,6 +25,18 @@ class Row_Types(Enum):
     FILE_INFO           = 140
     UNKNOWN             = -1
 
+# How the bytes of the strings in a logfile (names, units, serials, ...) are decoded.
+# The tester writes some raw bytes that are not valid in the encoding (e.g. the min of 10,4.1 in example_log.log),
+# by default those are replaced with U+FFFD, see https://docs.python.org/3/library/codecs.html#error-handlers for the others.
+LOGFILE_ENCODING = "utf-8"
+DEFAULT_ENCODING_ERRORS = "replace"
+
+# Bytes of the logfile decoded at a time by decoded_lines()
+LOGFILE_CHUNK_SIZE = 1 << 22
+
+# Bytes of the logfile hashed at a time by hash_logfile()
+HASH_CHUNK_SIZE = 1 << 20
+
 def row_number_to_row_types(row_number:int)->Row_Types:
     try:
         return Row_Types._value2member_map_[row_number]
@@ -84,59 +107,155 @@ def convert_data_to_float(data:str)->float|None:
     except ValueError:
         return None
 
+def test_data_config_from_row(row_list:list[str])->TEST_DATA_CONFIG:
+    "Turns a TEST_DATA_CONFIG (10) row of the CSV into its dataclass."
+    return TEST_DATA_CONFIG(
+                            test_id=            row_list[1],
+                            decimal_position=   int(row_list[2]),
+                            min=                convert_data_to_float(row_list[3]),
+                            max=                convert_data_to_float(row_list[4]),
+                            unit=               row_list[5],
+                            name=               row_list[6]
+                            )
+
+def test_data_from_row(row_list:list[str])->TEST_DATA:
+    "Turns a TEST_DATA (100) row of the CSV into its dataclass."
+    return TEST_DATA(
+                     test_id=   row_list[1],
+                     issue=     row_list[2],
+                     passed=    pass_fail_to_passed(row_list[3]),
+                     value=     float(row_list[4])
+                     )
+
+def test_summary_from_row(row_list:list[str])->TEST_SUMMARY:
+    "Turns a TEST_SUMMARY (130) row of the CSV into its dataclass."
+    return TEST_SUMMARY(
+                        site_num=       int(row_list[1]),
+                        time_completed= row_list[2],
+                        serial_num=     row_list[3],
+                        passed=         pass_fail_to_passed(row_list[4]),
+                        unknown1=       row_list[5],
+                        unknown2=       row_list[6],
+                        bin_num=        int(row_list[7]),
+                        unknown3=       row_list[8],
+                        unknown4=       row_list[9])
+
 def row_list_to_dataclass(row_list:list[str])->LOG_ROW:
     "Turns a row of the CSV into its associated dataclass."
     type:Row_Types = row_number_to_row_types(int(row_list[0]))
     match type:
         case Row_Types.TEST_DATA_CONFIG:
-            return TEST_DATA_CONFIG(
-                                    test_id=            row_list[1],
-                                    decimal_position=   int(row_list[2]),
-                                    min=                convert_data_to_float(row_list[3]),
-                                    max=                convert_data_to_float(row_list[4]),
-                                    unit=               row_list[5],
-                                    name=               row_list[6]
-                                    )
+            return test_data_config_from_row(row_list)
         case Row_Types.TEST_DATA:
-            return TEST_DATA(
-                             test_id=   row_list[1],
-                             issue=     row_list[2],
-                             passed=    pass_fail_to_passed(row_list[3]),
-                             value=     float(row_list[4])
-                             )
+            return test_data_from_row(row_list)
         case Row_Types.TEST_SUMMARY:
-            return TEST_SUMMARY(
-                                site_num=       int(row_list[1]),
-                                time_completed= row_list[2],
-                                serial_num=     row_list[3],
-                                passed=         pass_fail_to_passed(row_list[4]),
-                                unknown1=       row_list[5],
-                                unknown2=       row_list[6],
-                                bin_num=        int(row_list[7]),
-                                unknown3=       row_list[8],
-                                unknown4=       row_list[9])
+            return test_summary_from_row(row_list)
         case _:
             return UNSPECIFIED_LOG_ROW(type,row_list.copy()[1:])
 
-def interpreted_logfile(log_file_path: str) -> Generator[LOG_ROW, None,None]:
-    "This returns a generator that returns the dataclasses from interpreting rows of the logfile as they are needed."
-    with open(log_file_path,mode="r",newline="\n") as csvfile:
-        logreader = csv.reader(csvfile, delimiter=',', quotechar='"')
+# Constructors of the rows that make up nearly all of a logfile, by the text of their row number.
+# Looking these up directly skips row_number_to_row_types() and the match in row_list_to_dataclass().
+ROW_CONSTRUCTORS: dict[str,Callable[[list[str]],LOG_ROW]] = {
+    "10":   test_data_config_from_row,
+    "100":  test_data_from_row,
+    "130":  test_summary_from_row,
+}
+
+# Row numbers of the rows that belong to one requirement, by the test_id in their second field
+_REQUIREMENT_ROWS = {"10", "100"}
+
+@contextmanager
+def open_logfile_data(log_file_path:str) -> Generator[bytes|mmap.mmap,None,None]:
+    "Memory maps the logfile to read it as bytes, rather than decoding the whole file as text."
+    with open(log_file_path, mode="rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: # An empty file can not be memory mapped
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+def hash_logfile(log_file_path:str) -> str:
+    "sha256 of the contents of the logfile."
+    digest = hashlib.sha256()
+    with open(log_file_path, mode="rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def decoded_lines(data:bytes|mmap.mmap, start:int=0, end:int|None=None,
+                  encoding:str=LOGFILE_ENCODING, encoding_errors:str=DEFAULT_ENCODING_ERRORS) -> Generator[str,None,None]:
+    "Decodes the lines of data[start:end] (with their line endings) a chunk at a time, like reading the file as text with newline='\\n'."
+    end = len(data) if end is None else end
+    pos = start
+    while pos < end:
+        cut = data.rfind(b"\n", pos, min(pos+LOGFILE_CHUNK_SIZE, end)) + 1
+        if cut <= pos: # A line longer than a chunk
+            cut = data.find(b"\n", pos, end) + 1 or end
+        yield from io.StringIO(data[pos:cut].decode(encoding, encoding_errors), newline="\n")
+        pos = cut
+
+def interpreted_logfile(log_file_path: str, encoding:str=LOGFILE_ENCODING, encoding_errors:str=DEFAULT_ENCODING_ERRORS,
+                        start:int=0, end:int|None=None, test_ids:frozenset[str]|None=None) -> Generator[LOG_ROW, None,None]:
+    """This returns a generator that returns the dataclasses from interpreting rows of the logfile as they are needed.
+        start and end limit it to those bytes of the logfile, which must be at the start of a row.
+        With test_ids, only the TEST_DATA_CONFIG and TEST_DATA rows of those requirements are returned, the others are skipped before any dataclass is made.
+    """
+    with open_logfile_data(log_file_path) as data:
+        logreader = csv.reader(decoded_lines(data, start, end, encoding, encoding_errors), delimiter=',', quotechar='"')
         for row_num,row in enumerate(logreader):
+            if test_ids is not None and len(row) > 1 and row[0] in _REQUIREMENT_ROWS and row[1] not in test_ids:
+                continue
             try:
-                yield row_list_to_dataclass(list(row))
+                constructor = ROW_CONSTRUCTORS.get(row[0])
+                if constructor is not None:
+                    yield constructor(row)
+                else:
+                    yield row_list_to_dataclass(row)
             except Exception as e:
-                raise type(e)(str(e) + f"Occoured in line {row_num} of the logfile provided '{log_file_path}'").with_traceback(sys.exc_info()[2])
+                location = f"line {row_num}" if start == 0 else f"line {row_num} after byte {start}"
+                raise type(e)(str(e) + f"Occoured in {location} of the logfile provided '{log_file_path}'").with_traceback(sys.exc_info()[2])
                     #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
 
-def get_test_results_from_logfile(logfile:str) -> tuple[list[TEST_DATA_CONFIG],list[list[TEST_DATA]],list[TEST_SUMMARY]]:
-    """interprets log file and outputs the (config_rows, data, summaries) from all of the tests.
-        |-> config_rows:    List of all config rows, in logfile order, specify tests by id
-        |-> test_data:      List of lists of config data, inner list in same order as test_config_rows, outer in same order as test_summaries
-        |-> test_summaries: List all summaries in the order they are presented in logfile
-        *** This is a non-ideal solution, but it works, so it is not a problem. ***
+def read_header_rows(log_file_path:str, encoding:str=LOGFILE_ENCODING, encoding_errors:str=DEFAULT_ENCODING_ERRORS) -> list[UNSPECIFIED_LOG_ROW]:
+    "The rows at the start of the logfile (e.g. HEADER, FILE_INFO and WARNING rows), up to the first TEST_DATA_CONFIG, TEST_DATA or TEST_SUMMARY row."
+    header_rows = []
+    for row in interpreted_logfile(log_file_path, encoding, encoding_errors):
+        if not isinstance(row, UNSPECIFIED_LOG_ROW):
+            break
+        header_rows.append(row)
+    return header_rows
+
+def end_of_row(data:bytes|mmap.mmap, row_start:int) -> int:
+    "Index just after the line break ending the row that starts at row_start (its quoted fields can hold line breaks), -1 if it has none yet."
+    end = data.find(b"\n", row_start)
+    while end >= 0 and data[row_start:end].count(b'"') % 2:
+        end = data.find(b"\n", end+1)
+    return end + 1 if end >= 0 else -1
+
+def split_logfile_on_summaries(data:bytes|mmap.mmap, parts:int) -> list[tuple[int,int]]:
+    """Divides the logfile into about parts (start, end) byte ranges that can be interpreted on their own, in logfile order.
+        The first range is the header and config rows, up to the first TEST_DATA row. 
+        Every other range ends just after a TEST_SUMMARY row, so it holds only whole devices.
     """
-    
+    size = len(data)
+    first_data_row = 0 if data[:4] == b"100," else data.find(b"\n100,") + 1 or size
+    boundaries = [0, first_data_row]
+    for part in range(1, parts):
+        target = first_data_row + (size - first_data_row) * part // parts
+        summary_row = data.find(b"\n130,", max(target-1, boundaries[-1]))
+        if summary_row < 0:
+            break
+        boundary = end_of_row(data, summary_row+1)
+        if boundary < 0: # The last row of the logfile has no line break
+            boundary = size
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+def group_test_results(log_rows:Iterator[LOG_ROW]) -> tuple[list[TEST_DATA_CONFIG],list[list[TEST_DATA]],list[TEST_SUMMARY]]:
+    "Groups the interpreted rows of (part of) a logfile into (config_rows, data, summaries), see get_test_results_from_logfile()."
     # Extract all test data
     test_config_rows:   list[TEST_DATA_CONFIG]  =[] # list of all config rows, in logfile order, specify tests by id
     test_data:          list[list[TEST_DATA]]   =[] #List of lists of config data, inner list in same order as test_config_rows, outer in same order as test_summaries
@@ -145,7 +264,7 @@ def get_test_results_from_logfile(logfile:str) -> tuple[list[TEST_DATA_CONFIG],l
     processing_data = False # Flag notes when currently in a TEST_DATA section
 
     # Extract test results from logfile
-    for log_row in interpreted_logfile(logfile):
+    for log_row in log_rows:
 
         match log_row.type:
 
@@ -168,3 +287,551 @@ def get_test_results_from_logfile(logfile:str) -> tuple[list[TEST_DATA_CONFIG],l
     
     return (test_config_rows,test_data,test_summaries)
 
+def _get_test_results_from_range(logfile:str, encoding:str, encoding_errors:str, start:int, end:int) -> tuple[list[TEST_DATA_CONFIG],list[list[TEST_DATA]],list[TEST_SUMMARY]]:
+    "Worker process for get_test_results_from_logfile(), groups the rows of one range from split_logfile_on_summaries()."
+    return group_test_results(interpreted_logfile(logfile, encoding, encoding_errors, start, end))
+
+def get_test_results_from_logfile(logfile:str, encoding:str=LOGFILE_ENCODING, encoding_errors:str=DEFAULT_ENCODING_ERRORS,
+                                  workers:int=1) -> tuple[list[TEST_DATA_CONFIG],list[list[TEST_DATA]],list[TEST_SUMMARY]]:
+    """interprets log file and outputs the (config_rows, data, summaries) from all of the tests.
+        |-> config_rows:    List of all config rows, in logfile order, specify tests by id
+        |-> test_data:      List of lists of config data, inner list in same order as test_config_rows, outer in same order as test_summaries
+        |-> test_summaries: List all summaries in the order they are presented in logfile
+        With more than one worker, the logfile is split on its TEST_SUMMARY rows and each part is interpreted in its own process.
+        *** This is a non-ideal solution, but it works, so it is not a problem. ***
+    """
+    if workers <= 1:
+        return group_test_results(interpreted_logfile(logfile, encoding, encoding_errors))
+
+    with open_logfile_data(logfile) as data:
+        ranges = split_logfile_on_summaries(data, workers)
+    if len(ranges) < 2: # Nothing to split
+        return group_test_results(interpreted_logfile(logfile, encoding, encoding_errors))
+
+    # Each range starts outside of a TEST_DATA section, so the grouped parts can just be joined in logfile order
+    from concurrent.futures import ProcessPoolExecutor # Only imported when needed, importing it takes longer than reading a small logfile
+    test_config_rows, test_data, test_summaries = [], [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part_config_rows, part_data, part_summaries in pool.map(_get_test_results_from_range,
+                                                                     repeat(logfile), repeat(encoding), repeat(encoding_errors),
+                                                                     *zip(*ranges)):
+            test_config_rows += part_config_rows
+            test_data += part_data
+            test_summaries += part_summaries
+
+    return (test_config_rows,test_data,test_summaries)
+
+@dataclass
+class TEST_RESULTS:
+    """The results of interpreting a logfile once, stored by column so they can be shared between any number of output writers.
+        |-> config_rows:    List of all config rows, in logfile order, these are the column metadata of the arrays
+        |-> test_ids:       test_id of each column (interned strings, same order as config_rows)
+        |-> values:         2-D float array of measured values, [device, requirement]
+        |-> packed_passed:  2-D packed boolean array of which measurements passed (see passed), [device, requirement bits]
+        |-> packed_present: 2-D packed boolean array of which measurements are in the logfile (see present), [device, requirement bits]
+                            A device the tester stopped testing early has missing measurements, their values are NaN and they did not pass.
+        |-> issue_codes:    2-D array of the measurement issue (e.g. "FAIL"), as indexes into issues, [device, requirement] (0 when missing)
+        |-> issues:         The distinct issue strings, referenced by issue_codes
+        |-> test_summaries: List all summaries in the order they are presented in logfile, one per device
+        |-> site_nums, bin_nums, device_passed: Columns of test_summaries, one per device
+        |-> device_indexes: Index of each device among every device (TEST_SUMMARY row) in the logfile, including those a RESULTS_FILTER did not keep
+        |-> test_nums:      The test each device was in (0 for the first), one device on each site per test (see test_nums_from_device_indexes())
+    """
+    config_rows:    list[TEST_DATA_CONFIG]
+    test_ids:       np.ndarray
+    values:         np.ndarray
+    packed_passed:  np.ndarray
+    packed_present: np.ndarray
+    issue_codes:    np.ndarray
+    issues:         list[str]
+    test_summaries: list[TEST_SUMMARY]
+    site_nums:      np.ndarray
+    bin_nums:       np.ndarray
+    device_passed:  np.ndarray
+    device_indexes: np.ndarray
+    test_nums:      np.ndarray
+
+    @property
+    def passed(self)->np.ndarray:
+        "Unpacks packed_passed to a 2-D boolean array, [device, requirement]."
+        return np.unpackbits(self.packed_passed, axis=1, count=self.requirement_count).view(np.bool_)
+
+    @property
+    def present(self)->np.ndarray:
+        "Unpacks packed_present to a 2-D boolean array, [device, requirement]."
+        return np.unpackbits(self.packed_present, axis=1, count=self.requirement_count).view(np.bool_)
+
+    @cached_property
+    def column_index(self)->dict[str,int]:
+        "test_id -> index of its column in the arrays (e.g. results.values[:, results.column_index['2.1']])."
+        return {test_id: column for column, test_id in enumerate(self.test_ids.tolist())}
+
+    @property
+    def site_test_count(self)->int:
+        "Each site of each test counts as one site test (one per TEST_SUMMARY)."
+        return len(self.test_summaries)
+
+    @property
+    def site_count(self)->int:
+        "Number of distinct sites, assumes each site is used in each test."
+        return int(np.unique(self.site_nums).size)
+
+    @property
+    def requirement_count(self)->int:
+        "Each of the things that will be tested."
+        return len(self.config_rows)
+
+@dataclass(frozen=True)
+class RESULTS_FILTER:
+    """Which of the results in a logfile to keep when reading it, None keeps all of them.
+        |-> test_ids:   Only the requirements with these test_ids, the TEST_DATA rows of the others are skipped before their value is converted
+        |-> site_nums:  Only the devices tested on these sites
+        |-> bin_nums:   Only the devices put in these bins
+        |-> passed:     Only the devices that passed (True) or failed (False)
+        A device is only known once its TEST_SUMMARY row, which comes after its TEST_DATA rows, is read.
+        TEST_RESULTS_BUILDER looks ahead to it, so the rows of a device that is not kept are skipped without being split.
+    """
+    test_ids:   frozenset[str]|None = None
+    site_nums:  frozenset[int]|None = None
+    bin_nums:   frozenset[int]|None = None
+    passed:     bool|None = None
+
+    @property
+    def filters_devices(self)->bool:
+        "True if some devices may not be kept."
+        return self.site_nums is not None or self.bin_nums is not None or self.passed is not None
+
+    def keeps_device(self, site_num:int, bin_num:int, passed:bool)->bool:
+        "True if a device with these fields in its TEST_SUMMARY row is kept."
+        return (self.site_nums is None or site_num in self.site_nums) \
+            and (self.bin_nums is None or bin_num in self.bin_nums) \
+            and (self.passed is None or passed == self.passed)
+
+    def apply(self, results:TEST_RESULTS)->TEST_RESULTS:
+        "The part of results this filter keeps, for results that were read without it (e.g. loaded from a cache)."
+        devices = np.ones(results.site_test_count, dtype=np.bool_)
+        if self.site_nums is not None:
+            devices &= np.isin(results.site_nums, list(self.site_nums))
+        if self.bin_nums is not None:
+            devices &= np.isin(results.bin_nums, list(self.bin_nums))
+        if self.passed is not None:
+            devices &= results.device_passed == self.passed
+        columns = [column for column, config_row in enumerate(results.config_rows) if self.test_ids is None or config_row.test_id in self.test_ids]
+
+        return TEST_RESULTS(config_rows=    [results.config_rows[column] for column in columns],
+                            test_ids=       results.test_ids[columns],
+                            values=         results.values[devices][:, columns],
+                            packed_passed=  np.packbits(results.passed[devices][:, columns], axis=1),
+                            packed_present= np.packbits(results.present[devices][:, columns], axis=1),
+                            issue_codes=    results.issue_codes[devices][:, columns],
+                            issues=         list(results.issues),
+                            test_summaries= [summary for summary, kept in zip(results.test_summaries, devices.tolist()) if kept],
+                            site_nums=      results.site_nums[devices],
+                            bin_nums=       results.bin_nums[devices],
+                            device_passed=  results.device_passed[devices],
+                            device_indexes= results.device_indexes[devices],
+                            test_nums=      results.test_nums[devices])
+
+def test_nums_from_device_indexes(device_indexes:np.ndarray, site_count:int) -> np.ndarray:
+    """The test of each device (0 for the first) from its index among every device in the logfile, where each test is one device on each of the site_count sites
+        of the logfile. Devices a RESULTS_FILTER did not keep still count, so the devices that are kept stay in the test they were in.
+    """
+    return (device_indexes // max(site_count, 1)).astype(np.int32)
+
+def split_fixed_layout_row(line:str, field_count:int, quoted_fields:tuple[int,...]) -> list[str]|None:
+    """Splits a row into the same fields as csv.reader would, with a plain str.split() when the layout is known.
+        Returns None when the line does not exactly match the layout (e.g. a comma or escaped quote inside a string),
+        so it must be read with csv.reader instead. The trailing comma on every row gives an empty last field.
+    """
+    # Only the string fields may be quoted, so any other quote means this is not the fixed layout
+    if line.count('"') != 2*len(quoted_fields):
+        return None
+    row_list = line.rstrip("\r\n").split(",")
+    if len(row_list) != field_count:
+        return None
+    for i in quoted_fields:
+        field = row_list[i]
+        if len(field) < 2 or field[0] != '"' or field[-1] != '"':
+            return None
+        row_list[i] = field[1:-1]
+    return row_list
+
+# The quoted pass/fail field of a TEST_DATA row as it is in the logfile -> passed, see pass_fail_to_passed()
+_QUOTED_PASS_FAIL: dict[bytes,bool] = {b'"P"':True, b'"p"':True, b'"F"':False, b'"f"':False}
+
+def _fields_getter(indexes:list[int]) -> Callable[[list[bytes]],tuple[bytes,...]]:
+    "A function that returns the fields at indexes as a tuple, like itemgetter() but always a tuple."
+    if len(indexes) == 1:
+        index = indexes[0]
+        return lambda fields: (fields[index],)
+    return itemgetter(*indexes)
+
+# (value, passed, issue code) of a measurement that is not in the logfile
+_MISSING_CELL = (float("nan"), False, 0)
+
+# What is between the last field of one TEST_DATA row and the second field of the next, when split on ","
+_TEST_DATA_ROW_BREAKS = {b"\r\n100", b"\n100"}
+_TEST_DATA_LAST_ROW_ENDS = {b"\r\n", b"\n", b""}
+
+class TEST_RESULTS_BUILDER:
+    """Collects the rows of a logfile straight into the columns of a TEST_RESULTS, without a dataclass for each TEST_DATA row.
+        This works on the raw bytes of the logfile, only decoding the strings (issues, config rows, summaries, headers).
+        The TEST_DATA rows of a device are found as one block (up to its TEST_SUMMARY row) and decoded in bulk,
+        any block that does not match the fixed layout (e.g. 100,1.1,"    ","P",0.806,) and every other row is read with csv.reader.
+        Each TEST_DATA row goes in the column of its test_id (see column_index), a device's block only goes straight into the columns
+        when it has one row for each requirement in the order of the config rows. Requirements a device has no row for are missing.
+        With a RESULTS_FILTER, only the requirements and devices it keeps are added (see RESULTS_FILTER).
+    """
+    def __init__(self, source:str, encoding:str=LOGFILE_ENCODING, encoding_errors:str=DEFAULT_ENCODING_ERRORS,
+                 config_rows:list[TEST_DATA_CONFIG]|None=None, results_filter:RESULTS_FILTER|None=None):
+        "config_rows are the TEST_DATA_CONFIG rows already read (all of them), when only adding part of a logfile that does not start at the beginning."
+        self.source = source # Logfile path, for error messages
+        self.encoding = encoding
+        self.encoding_errors = encoding_errors
+        self.results_filter = results_filter
+        self.filters_devices = results_filter is not None and results_filter.filters_devices
+
+        self.config_rows:       list[TEST_DATA_CONFIG]  =[] # list of the config rows of the columns, in logfile order, specify tests by id
+        self.column_index:      dict[str,int]           ={} # test_id -> column of its requirement
+        self.logfile_config_rows: list[TEST_DATA_CONFIG]=[] # Every config row in the logfile, including those of the requirements not kept
+        self.raw_test_ids:      list[bytes]             =[] # test_id of every config row as it is in the logfile, to match whole blocks at once
+        self.kept_rows:         list[int]|None          =None if results_filter is None or results_filter.test_ids is None else []
+                                                            # Index of each column's row in a whole block, when not every requirement is kept
+        self.kept_fields:       Callable[[list[bytes]],tuple[bytes,...]]|None = None # fields of a whole block -> (issue, pass/fail, value) fields of the kept rows
+        self.skipped_test_ids:  set[str]                =set() # test_ids of the requirements that are not kept
+        self.test_summaries:    list[TEST_SUMMARY]      =[] # List all summaries in the order they are presented in logfile
+        self.device_indexes = array("q")                    # Index of each kept device among every device in the logfile
+        self.logfile_device_count = 0                       # Devices in the logfile so far, including those not kept
+        self.logfile_site_nums: set[int]                =set() # Sites of every device in the logfile so far, including those not kept
+
+        self.values = array("d")        # Flattened [device, requirement] values, in logfile order
+        self.passed = bytearray()       # Flattened [device, requirement] pass/fail, in logfile order
+        self.present = bytearray()      # Flattened [device, requirement] if the logfile has the measurement
+        self.issue_codes = array("H")   # Flattened [device, requirement] index into issues
+        self.issues: list[str] = []
+        self.issue_lookup: dict[bytes,int] = {} # quoted issue field as it is in the logfile -> index into issues
+
+        self.device_start = 0 # Index in the flattened columns where the current device's TEST_DATA starts
+        self.device_cells: dict[int,tuple[float,bool,int]] = {} # column -> (value, passed, issue code) of the current device's rows, when not added as a block
+        self.row_num = 0 # Line number of the next line added, for error messages
+
+        for config_row in config_rows or []:
+            self._add_config_row(config_row)
+
+    def _add_config_row(self, config_row:TEST_DATA_CONFIG) -> None:
+        self.raw_test_ids.append(config_row.test_id.encode(self.encoding, self.encoding_errors))
+        self.logfile_config_rows.append(config_row)
+        if self.kept_rows is not None:
+            if config_row.test_id not in self.results_filter.test_ids:
+                self.skipped_test_ids.add(config_row.test_id)
+                return
+            self.kept_rows.append(len(self.logfile_config_rows)-1)
+            self.kept_fields = _fields_getter([5*row + field for field in (2,3,4) for row in self.kept_rows])
+        self.column_index[config_row.test_id] = len(self.config_rows)
+        self.config_rows.append(config_row)
+
+    def add_data(self, data:bytes|mmap.mmap, start:int=0, end:int|None=None) -> None:
+        """Adds the next lines of the logfile from data[start:end], which must end at the end of a line (or the end of the logfile).
+            data can be a memory mapped logfile, only the TEST_DATA blocks and the rows being decoded are copied out of it.
+        """
+        pos = start
+        end_of_data = len(data) if end is None else end
+        while pos < end_of_data:
+            if data[pos:pos+4] == b"100,":
+                # The block of TEST_DATA rows runs up to the TEST_SUMMARY row of the device
+                row_end = data.find(b"\n130,", pos, end_of_data) + 1 or end_of_data
+                block = data[pos:row_end]
+                line_count = block.count(b"\n")
+                test_data_only = block.endswith(b"\n") and block.count(b"\n100,") == line_count-1
+                if test_data_only and self.filters_devices and (summary_end := self._skipped_device_end(data, row_end, end_of_data)):
+                    # Not kept, so neither the block nor its TEST_SUMMARY row are added
+                    self.row_num += line_count + 1
+                    row_end = summary_end
+                elif not (test_data_only and self._add_test_data_block(block, line_count)):
+                    self._add_rows(block)
+            else:
+                # One TEST_SUMMARY row per device, split without csv.reader when it is the fixed layout
+                row = None
+                if data[pos:pos+4] == b"130,":
+                    row_end = data.find(b"\n", pos, end_of_data) + 1 or end_of_data
+                    row = split_fixed_layout_row(self._decode(data[pos:row_end]), 11, (2,3,4))
+                if row is not None:
+                    self._add_rows_list([row])
+                else:
+                    # Every other row up to the next TEST_DATA row
+                    row_end = data.find(b"\n100,", pos, end_of_data) + 1 or end_of_data
+                    self._add_rows(data[pos:row_end])
+            pos = row_end
+
+    def _decode(self, raw:bytes) -> str:
+        "Decodes the bytes of a string in the logfile."
+        try:
+            return raw.decode(self.encoding, self.encoding_errors)
+        except UnicodeDecodeError as e:
+            row_num = self.row_num + raw.count(b"\n", 0, e.start)
+            raise UnicodeDecodeError(e.encoding, e.object, e.start, e.end,
+                                     e.reason + f". Occoured in line {row_num} of the logfile provided '{self.source}'"
+                                     ).with_traceback(sys.exc_info()[2])
+
+    def _skipped_device_end(self, data:bytes|mmap.mmap, summary_start:int, end_of_data:int) -> int:
+        "The end of the TEST_SUMMARY row at summary_start if the results filter does not keep its device, otherwise 0 (the device must be read)."
+        if data[summary_start:summary_start+4] != b"130," or self.device_cells or len(self.values) > self.device_start:
+            return 0
+        summary_end = data.find(b"\n", summary_start, end_of_data) + 1 or end_of_data
+        # Only a row in the fixed layout (see split_fixed_layout_row()) is read here, straight from its bytes
+        row = data[summary_start:summary_end]
+        fields = row.split(b",")
+        if len(fields) != 11 or row.count(b'"') != 6 or fields[4] not in _QUOTED_PASS_FAIL \
+            or not all(len(fields[i]) >= 2 and fields[i][:1] == b'"' and fields[i][-1:] == b'"' for i in (2,3)):
+            return 0
+        try:
+            site_num, bin_num = int(fields[1]), int(fields[7])
+        except ValueError:
+            return 0
+        if self.results_filter.keeps_device(site_num, bin_num, _QUOTED_PASS_FAIL[fields[4]]):
+            return 0
+        self._count_logfile_device(site_num)
+        return summary_end
+
+    def _add_test_data_block(self, block:bytes, row_count:int) -> bool:
+        "Decodes a block of only TEST_DATA rows together, returns False (adding nothing) if they are not all the fixed layout."
+        # Every row is 5 commas (with trailing comma) and 4 quotes (issue and pass/fail), so the fields repeat every 5
+        if block.count(b",") != 5*row_count or block.count(b'"') != 4*row_count:
+            return False
+        fields = block.split(b",")
+        if not (set(fields[5:-1:5]) <= _TEST_DATA_ROW_BREAKS and fields[-1] in _TEST_DATA_LAST_ROW_ENDS):
+            return False
+        if self.device_cells or fields[1::5] != self.raw_test_ids: # Not one row for each requirement, in order
+            return False
+        if self.kept_rows is None:
+            issue_fields, pass_fail_fields, value_fields = fields[2::5], fields[3::5], fields[4::5]
+        elif self.kept_rows: # Only the fields of the kept requirements are converted
+            kept_fields = self.kept_fields(fields)
+            kept_count = len(self.kept_rows)
+            issue_fields, pass_fail_fields, value_fields = kept_fields[:kept_count], kept_fields[kept_count:2*kept_count], kept_fields[2*kept_count:]
+        else:
+            issue_fields = pass_fail_fields = value_fields = ()
+        cell_count = len(value_fields)
+        try:
+            values = list(map(float, value_fields))
+            quoted_issue = issue_fields[0] if cell_count else b""
+            issue_code = self.issue_lookup.get(quoted_issue)
+            if issue_code is not None and pass_fail_fields[0] in _QUOTED_PASS_FAIL \
+                and issue_fields.count(quoted_issue) == cell_count and pass_fail_fields.count(pass_fail_fields[0]) == cell_count:
+                # Usually every row of a device has the same issue and pass/fail (e.g. all "    ","P")
+                passed = bytes([_QUOTED_PASS_FAIL[pass_fail_fields[0]]])*cell_count
+                issue_codes = [issue_code]*cell_count
+            else:
+                passed = bytes(map(_QUOTED_PASS_FAIL.__getitem__, pass_fail_fields))
+                try:
+                    issue_codes = list(map(self.issue_lookup.__getitem__, issue_fields))
+                except KeyError:
+                    for quoted_issue in [i for i in dict.fromkeys(issue_fields) if i not in self.issue_lookup]: # New issues, in logfile order
+                        if len(quoted_issue) < 2 or quoted_issue[:1] != b'"' or quoted_issue[-1:] != b'"':
+                            return False
+                        self._issue_code(self._decode(quoted_issue[1:-1]))
+                    issue_codes = list(map(self.issue_lookup.__getitem__, issue_fields))
+        except (KeyError, ValueError):
+            return False
+
+        self.values.fromlist(values)
+        self.passed.extend(passed)
+        self.present.extend(b"\x01"*cell_count)
+        self.issue_codes.fromlist(issue_codes)
+        self.row_num += row_count
+        return True
+
+    def _add_rows(self, raw:bytes) -> None:
+        "Decodes the lines and reads each row with csv.reader to add it."
+        self._add_rows_list(csv.reader(io.StringIO(self._decode(raw), newline="\n"), delimiter=',', quotechar='"'))
+
+    def _add_rows_list(self, rows:Iterator[list[str]]) -> None:
+        "Adds each row that has already been split into its fields."
+        for row in rows:
+            try:
+                self._add_row(row)
+            except Exception as e:
+                raise type(e)(str(e) + f"Occoured in line {self.row_num} of the logfile provided '{self.source}'").with_traceback(sys.exc_info()[2])
+                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
+            self.row_num += 1
+
+    def _issue_code(self, issue:str) -> int:
+        "Index of the issue in issues, adding it if it is new."
+        quoted_issue = ('"' + issue.replace('"','""') + '"').encode(self.encoding, self.encoding_errors)
+        issue_code = self.issue_lookup.get(quoted_issue)
+        if issue_code is None:
+            issue_code = self.issue_lookup[quoted_issue] = len(self.issues)
+            self.issues.append(issue)
+        return issue_code
+
+    def _add_row(self, row:list[str]) -> None:
+        "Adds a row that has been split by csv.reader."
+        if row[0] == "100":
+            try:
+                column = self.column_index[row[1]]
+            except KeyError:
+                if row[1] in self.skipped_test_ids: # Not one of the kept requirements
+                    return
+                raise ValueError(f"TEST_DATA row for test_id '{row[1]}', which has no TEST_DATA_CONFIG row. ") from None
+            if len(self.values) > self.device_start: # Rows of this device were already added as a block
+                self._take_back_device_cells()
+            self.device_cells[column] = (float(row[4]), pass_fail_to_passed(row[3]), self._issue_code(row[2])) # A repeated test_id keeps its last row
+            return
+
+        constructor = ROW_CONSTRUCTORS.get(row[0])
+        log_row = constructor(row) if constructor is not None else row_list_to_dataclass(row)
+        match log_row.type:
+            case Row_Types.TEST_DATA_CONFIG:
+                self._add_config_row(log_row)
+
+            case Row_Types.TEST_SUMMARY:
+                device_index = self._count_logfile_device(log_row.site_num)
+                if self.filters_devices and not self.results_filter.keeps_device(log_row.site_num, log_row.bin_num, log_row.passed):
+                    self._drop_device_cells()
+                    return
+                if len(self.values) == self.device_start: # Not added as a block, so place each row in the column of its test_id
+                    self._add_device_cells()
+                self.test_summaries.append(log_row)
+                self.device_indexes.append(device_index)
+                self.device_start = len(self.values)
+
+            case _:
+                pass
+
+    def _count_logfile_device(self, site_num:int) -> int:
+        "Counts a device of the logfile (kept or not), returns its index among every device in the logfile."
+        self.logfile_site_nums.add(site_num)
+        self.logfile_device_count += 1
+        return self.logfile_device_count - 1
+
+    def _take_back_device_cells(self) -> None:
+        "Moves the current device's cells from the columns back to device_cells, so more of its rows can be placed."
+        start = self.device_start
+        self.device_cells = {column: (value, bool(passed), issue_code) for column, (value, passed, issue_code)
+                             in enumerate(zip(self.values[start:], self.passed[start:], self.issue_codes[start:]))}
+        del self.values[start:], self.passed[start:], self.present[start:], self.issue_codes[start:]
+
+    def _drop_device_cells(self) -> None:
+        "Removes the current device's cells, for a device that is not kept."
+        start = self.device_start
+        del self.values[start:], self.passed[start:], self.present[start:], self.issue_codes[start:]
+        self.device_cells = {}
+
+    def _add_device_cells(self) -> None:
+        "Adds the current device's rows from device_cells to the columns, the requirements it has no row for are missing."
+        cells = self.device_cells
+        for column in range(len(self.config_rows)):
+            value, passed, issue_code = cells.get(column, _MISSING_CELL)
+            self.values.append(value)
+            self.passed.append(passed)
+            self.present.append(column in cells)
+            self.issue_codes.append(issue_code)
+        self.device_cells = {}
+
+    def results(self) -> TEST_RESULTS:
+        "The TEST_RESULTS of every device that has been completed by a TEST_SUMMARY row."
+        test_summaries = self.test_summaries
+        device_count = len(test_summaries)
+        requirement_count = len(self.config_rows)
+        shape = (device_count, requirement_count)
+        size = device_count*requirement_count
+        device_indexes = np.array(self.device_indexes[:device_count], dtype=np.int64)
+
+        return TEST_RESULTS(config_rows=    list(self.config_rows),
+                            test_ids=       np.array([c.test_id for c in self.config_rows], dtype=np.str_),
+                            values=         np.array(self.values[:size], dtype=np.float64).reshape(shape),
+                            packed_passed=  np.packbits(np.frombuffer(self.passed, dtype=np.bool_, count=size).reshape(shape), axis=1),
+                            packed_present= np.packbits(np.frombuffer(self.present, dtype=np.bool_, count=size).reshape(shape), axis=1),
+                            issue_codes=    np.array(self.issue_codes[:size], dtype=np.uint16).reshape(shape),
+                            issues=         list(self.issues),
+                            test_summaries= list(test_summaries),
+                            site_nums=      np.array([s.site_num for s in test_summaries], dtype=np.int32),
+                            bin_nums=       np.array([s.bin_num for s in test_summaries], dtype=np.int32),
+                            device_passed=  np.array([s.passed for s in test_summaries], dtype=np.bool_),
+                            device_indexes= device_indexes,
+                            test_nums=      test_nums_from_device_indexes(device_indexes, len(self.logfile_site_nums)))
+
+def merge_test_results(parts:list[TEST_RESULTS]) -> TEST_RESULTS:
+    """Joins the TEST_RESULTS of consecutive parts of a logfile (in logfile order) into one.
+        All parts must have the same config rows, the issue codes of each part are renumbered into one issues list.
+        The device_indexes and test_nums of each part must already count the devices of the parts before it.
+    """
+    first = parts[0]
+    issues: list[str] = []
+    issue_lookup: dict[str,int] = {}
+    issue_codes = []
+    for part in parts:
+        if [c.test_id for c in part.config_rows] != [c.test_id for c in first.config_rows]:
+            raise ValueError("Can only merge results with the same TEST_DATA_CONFIG rows.")
+        renumber = np.array([issue_lookup.setdefault(issue, len(issue_lookup)) for issue in part.issues] or [0], dtype=np.uint16)
+        issue_codes.append(renumber[part.issue_codes])
+    issues = list(issue_lookup)
+
+    return TEST_RESULTS(config_rows=    first.config_rows,
+                        test_ids=       first.test_ids,
+                        values=         np.concatenate([p.values for p in parts]),
+                        packed_passed=  np.concatenate([p.packed_passed for p in parts]),
+                        packed_present= np.concatenate([p.packed_present for p in parts]),
+                        issue_codes=    np.concatenate(issue_codes),
+                        issues=         issues,
+                        test_summaries= [s for p in parts for s in p.test_summaries],
+                        site_nums=      np.concatenate([p.site_nums for p in parts]),
+                        bin_nums=       np.concatenate([p.bin_nums for p in parts]),
+                        device_passed=  np.concatenate([p.device_passed for p in parts]),
+                        device_indexes= np.concatenate([p.device_indexes for p in parts]),
+                        test_nums=      np.concatenate([p.test_nums for p in parts]))
+
+def _read_test_results_range(logfile:str, encoding:str, encoding_errors:str, config_rows:list[TEST_DATA_CONFIG],
+                             results_filter:RESULTS_FILTER|None, start:int, end:int) -> tuple[TEST_RESULTS,int,set[int]]:
+    """Worker process for read_test_results(), reads the devices in one range from split_logfile_on_summaries().
+        Also returns the number of devices in the range and their sites (including those not kept), to number the devices of the whole logfile.
+    """
+    builder = TEST_RESULTS_BUILDER(f"{logfile} (from byte {start})", encoding, encoding_errors, config_rows, results_filter)
+    with open_logfile_data(logfile) as data:
+        builder.add_data(data, start, end)
+    return builder.results(), builder.logfile_device_count, builder.logfile_site_nums
+
+def read_test_results(logfile:str, encoding:str=LOGFILE_ENCODING, encoding_errors:str=DEFAULT_ENCODING_ERRORS, workers:int=1,
+                      results_filter:RESULTS_FILTER|None=None) -> TEST_RESULTS:
+    """Interprets the logfile a single time into a TEST_RESULTS to hand to the output writers.
+        The logfile is memory mapped and read as bytes, TEST_DATA rows are stored straight into the columns
+        instead of building a dataclass for each of them. See LOGFILE_ENCODING for how strings are decoded.
+        With more than one worker, the logfile is split on its TEST_SUMMARY rows and each part is read in its own process.
+        With a results_filter, only the requirements and devices it keeps are read (see RESULTS_FILTER).
+    """
+    builder = TEST_RESULTS_BUILDER(logfile, encoding, encoding_errors, results_filter=results_filter)
+    with open_logfile_data(logfile) as data:
+        with profiling.stage("split logfile"):
+            ranges = split_logfile_on_summaries(data, workers) if workers > 1 else []
+        if len(ranges) < 2: # Nothing to split
+            with profiling.stage("parse rows") as stage:
+                builder.add_data(data)
+                stage.add(len(data), "bytes")
+            with profiling.stage("build arrays") as stage:
+                results = builder.results()
+                stage.add(results.values.size, "cells")
+            return results
+
+        # Read the header and config rows here, so every worker knows the requirements
+        (header_start, header_end), *ranges = ranges
+        builder.add_data(data, header_start, header_end)
+
+    from concurrent.futures import ProcessPoolExecutor # Only imported when needed, importing it takes longer than reading a small logfile
+    with profiling.stage(f"parse rows in {workers} processes") as stage:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_read_test_results_range,
+                                  repeat(logfile), repeat(encoding), repeat(encoding_errors), repeat(builder.logfile_config_rows), repeat(results_filter),
+                                  *zip(*ranges)))
+        stage.add(ranges[-1][1] - header_end, "bytes")
+    with profiling.stage("merge parts") as stage:
+        # Each part numbered its devices from 0, so offset them by the devices of the parts before it, and number the tests by the sites of every part
+        first_device_index, site_nums = 0, set()
+        for part, part_device_count, part_site_nums in parts:
+            part.device_indexes += first_device_index
+            first_device_index += part_device_count
+            site_nums |= part_site_nums
+        for part, _, _ in parts:
+            part.test_nums = test_nums_from_device_indexes(part.device_indexes, len(site_nums))
+        results = merge_test_results([part for part, _, _ in parts])
+        stage.add(results.values.size, "cells")
+    return results
@@ -0,0 +1,325 @@
+from dataclasses import dataclass
+import contextlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import urllib.parse
+import numpy as np
+import src.logfile_reading as lf
+import src.requirement_statistics as stats
+from src.results_cache import RESULTS_CACHE
+
+DEFAULT_STORE_PATH = "lots.sqlite"
+
+# Change whenever the tables change, a store made with another version has to be made again
+STORE_SCHEMA_VERSION = 1
+
+# Every table is keyed by lot_id, so the rows of a lot are added in one transaction and found together.
+# The measurements of each requirement in a lot are one row of arrays (a value for each device, in logfile order), not a row per measurement:
+# SQLite adds a few hundred thousand rows a second at most, and a lot can have millions of measurements.
+# The site and bin of each device are kept as arrays in lots as well, to select the measurements of a site or bin with numpy.
+# lot_statistics has the statistics of each requirement of each lot (site_num is NULL for all sites), so trends never read the measurements.
+STORE_SCHEMA = f"""
+PRAGMA user_version = {STORE_SCHEMA_VERSION};
+CREATE TABLE IF NOT EXISTS lots (
+    lot_id          INTEGER PRIMARY KEY,
+    sha256          TEXT NOT NULL UNIQUE,
+    logfile         TEXT NOT NULL,
+    tested_at       REAL NOT NULL,
+    ingested_at     REAL NOT NULL,
+    device_count    INTEGER NOT NULL,
+    passed_count    INTEGER NOT NULL,
+    issues          TEXT NOT NULL,
+    site_nums       BLOB NOT NULL,
+    bin_nums        BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS header_rows (
+    lot_id          INTEGER NOT NULL REFERENCES lots(lot_id),
+    row_index       INTEGER NOT NULL,
+    row_type        INTEGER NOT NULL,
+    fields          TEXT NOT NULL,
+    PRIMARY KEY (lot_id, row_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS requirements (
+    lot_id          INTEGER NOT NULL REFERENCES lots(lot_id),
+    test_id         TEXT NOT NULL,
+    column_index    INTEGER NOT NULL,
+    decimal_position INTEGER NOT NULL,
+    upper_limit     REAL,
+    lower_limit     REAL,
+    unit            TEXT NOT NULL,
+    name            TEXT NOT NULL,
+    PRIMARY KEY (lot_id, test_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS devices (
+    lot_id          INTEGER NOT NULL REFERENCES lots(lot_id),
+    device_index    INTEGER NOT NULL,
+    site_num        INTEGER NOT NULL,
+    time_completed  TEXT NOT NULL,
+    serial_num      TEXT NOT NULL,
+    passed          INTEGER NOT NULL,
+    bin_num         INTEGER NOT NULL,
+    PRIMARY KEY (lot_id, device_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS measurements (
+    test_id         TEXT NOT NULL,
+    lot_id          INTEGER NOT NULL REFERENCES lots(lot_id),
+    "values"        BLOB NOT NULL,
+    passed          BLOB NOT NULL,
+    issue_codes     BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lot_statistics (
+    test_id         TEXT NOT NULL,
+    site_num        INTEGER,
+    lot_id          INTEGER NOT NULL REFERENCES lots(lot_id),
+    count           INTEGER NOT NULL,
+    mean            REAL,
+    std             REAL,
+    minimum         REAL,
+    maximum         REAL,
+    fail_count      INTEGER NOT NULL,
+    yield_fraction  REAL,
+    cp              REAL,
+    cpk             REAL
+);
+CREATE INDEX IF NOT EXISTS lots_by_time ON lots (tested_at);
+CREATE INDEX IF NOT EXISTS devices_by_site ON devices (site_num, lot_id);
+CREATE INDEX IF NOT EXISTS devices_by_bin ON devices (bin_num, lot_id);
+CREATE INDEX IF NOT EXISTS devices_by_time ON devices (time_completed);
+CREATE UNIQUE INDEX IF NOT EXISTS measurements_by_test ON measurements (test_id, lot_id);
+CREATE UNIQUE INDEX IF NOT EXISTS lot_statistics_by_test ON lot_statistics (test_id, site_num, lot_id);
+"""
+
+# How the arrays of the measurements of a requirement are stored (the bytes of each array, little-endian)
+MEASUREMENT_DTYPES = {"values": np.dtype("<f8"), "passed": np.dtype("?"), "issue_codes": np.dtype("<u2")}
+# How lots.site_nums and lots.bin_nums are stored
+DEVICE_DTYPE = np.dtype("<i4")
+
+# Columns of lot_statistics that a LOT_TREND has an array of, in the order they are selected
+TREND_STATISTICS = ("count", "mean", "std", "minimum", "maximum", "fail_count", "yield_fraction", "cp", "cpk")
+
+@dataclass
+class LOT_TREND:
+    """The statistics of one requirement in each lot, oldest lot first. Every field is an array with one value per lot.
+        |-> lot_ids, logfiles: The lots, as stored by LOT_STORE.ingest()
+        |-> tested_at:      When the lot's logfile was last written (seconds since the epoch)
+        |-> count ... cpk:  Statistics of the requirement in the lot, as in REQUIREMENT_STATISTICS (NaN where they can't be calculated)
+    """
+    test_id:        str
+    site_num:       int|None
+    lot_ids:        np.ndarray
+    logfiles:       np.ndarray
+    tested_at:      np.ndarray
+    count:          np.ndarray
+    mean:           np.ndarray
+    std:            np.ndarray
+    minimum:        np.ndarray
+    maximum:        np.ndarray
+    fail_count:     np.ndarray
+    yield_fraction: np.ndarray
+    cp:             np.ndarray
+    cpk:            np.ndarray
+
+def _read_lot(logfile:str, store_path:str, encoding:str, encoding_errors:str,
+              cache:RESULTS_CACHE|None) -> tuple[str,list[lf.UNSPECIFIED_LOG_ROW]|None,lf.TEST_RESULTS|None]:
+    """Worker process for LOT_STORE.ingest_logfiles(), hashes one logfile then interprets it (or loads it from the cache),
+        returns (its sha256, header rows, results), without the header rows and results if the store already has it.
+    """
+    logfile_hash = lf.hash_logfile(logfile)
+    if _stored(store_path, logfile_hash):
+        return logfile_hash, None, None
+    header_rows = lf.read_header_rows(logfile, encoding, encoding_errors)
+    if cache is None:
+        return logfile_hash, header_rows, lf.read_test_results(logfile, encoding=encoding, encoding_errors=encoding_errors)
+    return logfile_hash, header_rows, cache.read_test_results(logfile, encoding=encoding, encoding_errors=encoding_errors)[0]
+
+def _stored(store_path:str, logfile_hash:str) -> bool:
+    "If the store at store_path has the logfile with this sha256, read without a LOT_STORE (nor a lock) so workers can check as they go."
+    try:
+        with contextlib.closing(sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(store_path))}?mode=ro", uri=True)) as connection:
+            return connection.execute("SELECT 1 FROM lots WHERE sha256 = ?", (logfile_hash,)).fetchone() is not None
+    except sqlite3.Error:
+        return False # e.g. an in-memory store, the lot is checked again when it is added
+
+def _nullable(values:np.ndarray) -> list:
+    "Values of a float array to store, NaN as NULL."
+    return [None if value != value else value for value in values.tolist()]
+
+class LOT_STORE:
+    """A SQLite database of every lot (logfile) added to it, to query requirements across lots without interpreting the logfiles again.
+        |-> Each logfile is added once, by the sha256 of its contents, adding it again does nothing.
+        |-> A lot is added in a single transaction, so a lot is either completely in the store or not at all.
+        |-> Trends of a requirement across lots come from the statistics stored for each lot, so they stay fast as the store grows.
+        |-> The measurements of a lot (an array over its devices for each requirement) can be read back with measurements().
+    """
+    def __init__(self, path:str=DEFAULT_STORE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL") # Queries can run while a lot is being added
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, STORE_SCHEMA_VERSION):
+            raise ValueError(f"The lot store '{path}' was made by another version (schema {version}, expected {STORE_SCHEMA_VERSION}), make it again.")
+        self.connection.executescript(STORE_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "LOT_STORE":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def lot_id(self, logfile_hash:str) -> int|None:
+        "lot_id of the logfile with this sha256, None if it has not been added."
+        row = self.connection.execute("SELECT lot_id FROM lots WHERE sha256 = ?", (logfile_hash,)).fetchone()
+        return None if row is None else row[0]
+
+    def ingest(self, logfile:str, encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS,
+               workers:int=1, cache:RESULTS_CACHE|None=None) -> tuple[int,bool]:
+        "Adds a logfile to the store unless it is already in it, returns (its lot_id, if it was added now)."
+        logfile_hash = lf.hash_logfile(logfile)
+        lot_id = self.lot_id(logfile_hash)
+        if lot_id is not None:
+            return lot_id, False
+        header_rows = lf.read_header_rows(logfile, encoding, encoding_errors)
+        if cache is None:
+            results = lf.read_test_results(logfile, encoding=encoding, encoding_errors=encoding_errors, workers=workers)
+        else:
+            results, _ = cache.read_test_results(logfile, encoding=encoding, encoding_errors=encoding_errors, workers=workers)
+        return self.add_lot(logfile, logfile_hash, header_rows, results), True
+
+    def ingest_logfiles(self, logfiles:list[str], encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS,
+                        jobs:int|None=None, cache:RESULTS_CACHE|None=None) -> dict[str,tuple[int|None,str]]:
+        """Adds every logfile that is not already in the store, hashing and interpreting them in a pool of jobs processes (default: one per CPU).
+            |-> Each worker hashes its logfile and only interprets it if the store doesn't have it yet, so adding the same directory again only reads each logfile once
+            |-> The lots are added here as they are interpreted, as SQLite only lets one connection write at a time.
+                A lot with the same sha256 as one added meanwhile (e.g. a copy of another logfile) is not added, see STORE_SCHEMA.
+            Returns {logfile: (lot_id, "added", "already stored", "same contents as another logfile" or the error)}, lot_id is None if it failed.
+        """
+        if not logfiles:
+            return {}
+        outcomes: dict[str,tuple[int|None,str]] = {}
+        added_hashes: set[str] = set()
+        from concurrent.futures import ProcessPoolExecutor, as_completed # Only imported when needed, see read_test_results()
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count() or 1, len(logfiles))) as pool:
+            futures = {pool.submit(_read_lot, logfile, self.path, encoding, encoding_errors, cache): logfile for logfile in logfiles}
+            for future in as_completed(futures):
+                logfile = futures[future]
+                try:
+                    logfile_hash, header_rows, results = future.result()
+                    if results is None:
+                        outcomes[logfile] = (self.lot_id(logfile_hash), "already stored")
+                    else:
+                        try:
+                            outcomes[logfile] = (self.add_lot(logfile, logfile_hash, header_rows, results), "added")
+                            added_hashes.add(logfile_hash)
+                        except sqlite3.IntegrityError:
+                            lot_id = self.lot_id(logfile_hash)
+                            if lot_id is None:
+                                raise
+                            outcomes[logfile] = (None, "same contents as another logfile") if logfile_hash in added_hashes else (lot_id, "already stored")
+                except Exception as e:
+                    outcomes[logfile] = (None, f"{type(e).__name__}: {e}")
+                print(f"{outcomes[logfile][1]:>7}  {logfile}", file=sys.stderr)
+        return {logfile: outcomes[logfile] for logfile in logfiles}
+
+    def add_lot(self, logfile:str, logfile_hash:str, header_rows:list[lf.UNSPECIFIED_LOG_ROW], results:lf.TEST_RESULTS) -> int:
+        "Adds the interpreted results of a logfile as a new lot in one transaction, returns its lot_id."
+        device_count = len(results.test_summaries)
+        site_nums, bin_nums = results.site_nums.tolist(), results.bin_nums.tolist()
+
+        # The measurements of each requirement as arrays over the devices (see STORE_SCHEMA), missing measurements are NaN
+        values, passed, issue_codes = results.values.T, results.passed.T, results.issue_codes.T
+        measurement_rows = ((test_id, np.ascontiguousarray(values[c], dtype=MEASUREMENT_DTYPES["values"]).tobytes(),
+                                      np.ascontiguousarray(passed[c], dtype=MEASUREMENT_DTYPES["passed"]).tobytes(),
+                                      np.ascontiguousarray(issue_codes[c], dtype=MEASUREMENT_DTYPES["issue_codes"]).tobytes())
+                            for c, test_id in enumerate(results.test_ids.tolist()))
+
+        statistics = stats.compute_requirement_statistics(results)
+        group_sites = [None] + np.unique(results.site_nums).tolist() # The order of statistics.groups
+        statistics_rows = []
+        for g, site_num in enumerate(group_sites):
+            group_columns = [statistics.count[g].tolist(), _nullable(statistics.mean[g]), _nullable(statistics.std[g]),
+                             _nullable(statistics.minimum[g]), _nullable(statistics.maximum[g]), statistics.fail_count[g].tolist(),
+                             _nullable(statistics.yield_fraction[g]), _nullable(statistics.cp[g]), _nullable(statistics.cpk[g])]
+            statistics_rows += [(test_id, site_num, *row) for test_id, *row in zip(results.test_ids.tolist(), *group_columns)]
+
+        with self.connection: # One transaction, rolled back if anything fails
+            lot_id = self.connection.execute("INSERT INTO lots VALUES (NULL,?,?,?,?,?,?,?,?,?)",
+                                             (logfile_hash, os.path.abspath(logfile), os.path.getmtime(logfile), time.time(),
+                                              device_count, int(results.device_passed.sum()), json.dumps(results.issues),
+                                              results.site_nums.astype(DEVICE_DTYPE).tobytes(), results.bin_nums.astype(DEVICE_DTYPE).tobytes())).lastrowid
+            self.connection.executemany("INSERT INTO header_rows VALUES (?,?,?,?)",
+                                        ((lot_id, i, row.type.value, json.dumps(row.data)) for i, row in enumerate(header_rows)))
+            self.connection.executemany("INSERT INTO requirements VALUES (?,?,?,?,?,?,?,?)",
+                                        ((lot_id, c.test_id, i, c.decimal_position, c.min, c.max, c.unit, c.name)
+                                         for i, c in enumerate(results.config_rows)))
+            self.connection.executemany("INSERT INTO devices VALUES (?,?,?,?,?,?,?)",
+                                        ((lot_id, i, site_nums[i], s.time_completed, s.serial_num, s.passed, bin_nums[i])
+                                         for i, s in enumerate(results.test_summaries)))
+            self.connection.executemany("INSERT INTO measurements VALUES (?,?,?,?,?)",
+                                        ((test_id, lot_id, *row) for test_id, *row in measurement_rows))
+            self.connection.executemany(f"INSERT INTO lot_statistics (test_id, site_num, lot_id, {', '.join(TREND_STATISTICS)}) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                                        ((test_id, site_num, lot_id, *row) for test_id, site_num, *row in statistics_rows))
+        return lot_id
+
+    def lots(self) -> list[tuple]:
+        "(lot_id, logfile, tested_at, device_count, passed_count) of every lot, oldest first."
+        return self.connection.execute("SELECT lot_id, logfile, tested_at, device_count, passed_count FROM lots ORDER BY tested_at, lot_id").fetchall()
+
+    def trend(self, test_id:str, site_num:int|None=None, last:int|None=None, since:float|None=None) -> LOT_TREND:
+        """The statistics of a requirement in each lot that has it, for all sites or one site, oldest lot first.
+            last limits it to the most recent lots, since to lots tested at or after that time (seconds since the epoch).
+            e.g. store.trend("3.1", last=200).mean is the mean of requirement 3.1 in each of the last 200 lots.
+        """
+        query = (f"SELECT lots.lot_id, lots.logfile, lots.tested_at, {', '.join(f's.{name}' for name in TREND_STATISTICS)} "
+                 "FROM lot_statistics AS s JOIN lots ON lots.lot_id = s.lot_id "
+                 "WHERE s.test_id = ? AND s.site_num IS ? AND lots.tested_at >= ? "
+                 "ORDER BY lots.tested_at DESC, lots.lot_id DESC LIMIT ?")
+        rows = self.connection.execute(query, (test_id, site_num, -np.inf if since is None else since, -1 if last is None else last)).fetchall()
+        rows.reverse()
+        columns = list(zip(*rows)) or [()] * (3 + len(TREND_STATISTICS))
+        lot_ids, logfiles, tested_at, *statistics = columns
+        return LOT_TREND(test_id, site_num,
+                         lot_ids=   np.array(lot_ids, dtype=np.int64),
+                         logfiles=  np.array(logfiles, dtype=np.str_),
+                         tested_at= np.array(tested_at, dtype=np.float64),
+                         **{name: np.array(column, dtype=np.int64 if name in ("count", "fail_count") else np.float64)
+                            for name, column in zip(TREND_STATISTICS, statistics)})
+
+    def measurements(self, test_id:str, lot_ids:list[int]|None=None, site_num:int|None=None, bin_num:int|None=None) -> tuple[np.ndarray,np.ndarray]:
+        """(lot_id, value) of every measurement of a requirement, in the given lots (default: all), of the devices on one site or in one bin.
+            Lots are in lot_id order, the devices of each lot in logfile order.
+            e.g. lot_ids, values = store.measurements("3.1", site_num=2) to plot the distribution of each lot.
+        """
+        query = ('SELECT m.lot_id, m."values", lots.site_nums, lots.bin_nums FROM measurements AS m JOIN lots ON lots.lot_id = m.lot_id '
+                 "WHERE m.test_id = ?")
+        parameters: list = [test_id]
+        if lot_ids is not None:
+            query += f" AND m.lot_id IN ({', '.join('?' * len(lot_ids))})"
+            parameters += lot_ids
+        lots, values = [], []
+        for lot_id, lot_values, lot_sites, lot_bins in self.connection.execute(query + " ORDER BY m.lot_id", parameters):
+            lot_values = np.frombuffer(lot_values, dtype=MEASUREMENT_DTYPES["values"])
+            selected = ~np.isnan(lot_values)
+            if site_num is not None:
+                selected &= np.frombuffer(lot_sites, dtype=DEVICE_DTYPE) == site_num
+            if bin_num is not None:
+                selected &= np.frombuffer(lot_bins, dtype=DEVICE_DTYPE) == bin_num
+            values.append(lot_values[selected])
+            lots.append(np.full(len(values[-1]), lot_id, dtype=np.int64))
+        if not values:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=MEASUREMENT_DTYPES["values"])
+        return np.concatenate(lots), np.concatenate(values)
+
+def print_trend(trend:LOT_TREND, file=sys.stdout) -> None:
+    "Prints the trend a lot per line."
+    print(f"Requirement {trend.test_id}, {'all sites' if trend.site_num is None else f'site {trend.site_num}'}: {len(trend.lot_ids)} lots", file=file)
+    print(f"{'Lot':>6}  {'Tested':<19}  {'Count':>7}  {'Mean':>12}  {'Std Dev':>12}  {'Yield %':>7}  {'Cpk':>7}  Logfile", file=file)
+    for i, lot_id in enumerate(trend.lot_ids.tolist()):
+        print(f"{lot_id:>6}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trend.tested_at[i]))}  {trend.count[i]:>7}  "
+              f"{trend.mean[i]:>12.6g}  {trend.std[i]:>12.6g}  {100*trend.yield_fraction[i]:>7.2f}  {trend.cpk[i]:>7.3f}  {trend.logfiles[i]}", file=file)
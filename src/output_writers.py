@@ -0,0 +1,41 @@
+from typing import Any, Protocol
+import importlib
+import src.logfile_reading as lf
+import src.profiling as profiling
+
+class OUTPUT_WRITER(Protocol):
+    "Anything that can turn interpreted logfile results into an output file, options are keyword arguments specific to the writer."
+    def __call__(self, results: lf.TEST_RESULTS, targetfile: str, **options: Any) -> None: ...
+
+class LAZY_WRITER:
+    """An OUTPUT_WRITER that imports the module it is in the first time it is called.
+        The modules of formats that are not written are never imported, along with what they need (e.g. xlsxwriter, pyarrow, config.toml).
+    """
+    def __init__(self, module: str, name: str):
+        self.module = module
+        self.name = name
+
+    def __call__(self, results: lf.TEST_RESULTS, targetfile: str, **options: Any) -> None:
+        return getattr(importlib.import_module(self.module), self.name)(results, targetfile, **options)
+
+# Output writers by the file extension they produce. Add a new output format by adding a writer here.
+OUTPUT_WRITERS: dict[str, OUTPUT_WRITER] = {
+    "csv":  LAZY_WRITER("src.csv_writing", "results_to_csv"),
+    "xlsx": LAZY_WRITER("src.excel_writing", "results_to_excel"),
+    "stats.csv": LAZY_WRITER("src.csv_writing", "statistics_to_csv"),
+    "parquet": LAZY_WRITER("src.parquet_export", "results_to_parquet"),
+}
+
+def write_results(results: lf.TEST_RESULTS, output_name: str, output_formats: list[str],
+                  writer_options: dict[str, dict[str, Any]] | None = None) -> None:
+    """Hands the same results to the writer of each requested format, writing to output_name.<format>.
+        writer_options are the options to pass to the writer of a format, e.g. {"xlsx": {"constant_memory": True}}
+    """
+    writer_options = writer_options or {}
+    for output_format in output_formats:
+        try:
+            writer = OUTPUT_WRITERS[output_format]
+        except KeyError as e:
+            raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(OUTPUT_WRITERS)}") from e
+        with profiling.stage(f"write {output_format}"):
+            writer(results, f"{output_name}.{output_format}", **writer_options.get(output_format, {}))
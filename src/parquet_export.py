@@ -0,0 +1,81 @@
+import sys
+import numpy as np
+import src.logfile_reading as lf
+
+# pyarrow is optional, it is only needed to write or read .parquet files (poetry install --extras parquet)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Rows in each row group of the .parquet file. The rows are sorted by test_id then site, so each row group only holds
+# a few (test_id, site) pairs and the min/max statistics of each row group let a filtered read skip the rest.
+PARQUET_ROW_GROUP_SIZE = 1 << 16
+
+def require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Writing and reading .parquet files needs pyarrow, install it with 'poetry install --extras parquet' (or 'pip install pyarrow').")
+
+def results_to_table(results:lf.TEST_RESULTS) -> "pa.Table":
+    """The results in long format, one row for each measurement, sorted by test_id, then site, then device (in logfile order).
+        |-> device:         Index of the device (its TEST_SUMMARY) in the logfile, counting the devices a RESULTS_FILTER did not keep
+        |-> site, bin:      Site and bin number of the device
+        |-> device_passed:  If the device passed overall
+        |-> test_id:        The requirement measured
+        |-> value, passed, issue: The measurement, null if the device has no measurement for the requirement
+    """
+    require_pyarrow()
+    device_count, requirement_count = results.values.shape
+
+    device_order = np.argsort(results.site_nums, kind="stable") # By site, then in logfile order
+    column_order = np.argsort(results.test_ids, kind="stable") # By test_id, so the row group statistics of test_id are in order
+
+    def by_measurement(array:np.ndarray) -> np.ndarray:
+        "[device, requirement] array -> one value per row of the table."
+        return array[device_order][:, column_order].T.ravel()
+
+    def by_device(array:np.ndarray) -> np.ndarray:
+        "one value per device -> one value per row of the table."
+        return np.tile(array[device_order], requirement_count)
+
+    missing = ~by_measurement(results.present)
+    issue_codes = by_measurement(results.issue_codes).astype(np.int32)
+    issue_codes[missing] = 0 # Missing cells have no issue, and there may be no issues to index at all
+    issues = results.issues or [""]
+
+    return pa.table({
+        "device":           pa.array(by_device(results.device_indexes.astype(np.int32))),
+        "site":             pa.array(by_device(results.site_nums)),
+        "bin":              pa.array(by_device(results.bin_nums)),
+        "device_passed":    pa.array(by_device(results.device_passed)),
+        "test_id":          strings(np.repeat(np.arange(requirement_count, dtype=np.int32), device_count), results.test_ids[column_order].tolist()),
+        "value":            pa.array(by_measurement(results.values), mask=missing),
+        "passed":           pa.array(by_measurement(results.passed), mask=missing),
+        "issue":            strings(pa.array(issue_codes, mask=missing), issues),
+    })
+
+def strings(codes, dictionary:list[str]) -> "pa.Array":
+    """The string at each code. Stored as plain strings (not a dictionary type), as filters on dictionary columns can't use
+        the row group statistics to skip row groups. Parquet still dictionary encodes them in the file.
+    """
+    return pa.DictionaryArray.from_arrays(codes, pa.array(dictionary, type=pa.string())).cast(pa.string())
+
+def results_to_parquet(results:lf.TEST_RESULTS, targetfile:str) -> None:
+    "Writes the results in long format (see results_to_table()) to a .parquet file, in row groups that can be skipped by read_parquet_results()."
+    table = results_to_table(results)
+    try:
+        pq.write_table(table, targetfile, row_group_size=PARQUET_ROW_GROUP_SIZE, compression="zstd", write_statistics=True)
+    except PermissionError as e:
+        raise type(e)(str(e) + f"You may have this file open in another program.'").with_traceback(sys.exc_info()[2])
+                    #https://stackoverflow.com/questions/6062576/adding-information-to-an-exception
+
+def read_parquet_results(parquet_file:str, test_ids:list[str]|None=None, sites:list[int]|None=None, bins:list[int]|None=None,
+                         columns:list[str]|None=None) -> "pa.Table":
+    """Reads the rows of a .parquet file from results_to_parquet() for only the given test_ids, sites and bins (default: all of them).
+        Row groups that can't hold any of them are skipped without being read, and only the given columns are read (default: all).
+        e.g. read_parquet_results("lot.parquet", test_ids=["2.1"], sites=[2], columns=["device","value"]).column("value").to_numpy()
+    """
+    require_pyarrow()
+    filters = [(name, "in", list(wanted)) for name, wanted in (("test_id", test_ids), ("site", sites), ("bin", bins)) if wanted is not None]
+    return pq.read_table(parquet_file, columns=columns, filters=filters or None)
@@ -0,0 +1,118 @@
+"""Interprets a logfile and writes its outputs as a pipeline of stages joined by bounded queues, instead of one stage after the other.
+    |-> reader:  a thread reads the logfile in chunks of whole devices into a queue of at most queue_size chunks,
+                 its reads release the GIL so reading from disk overlaps parsing, and only that many chunks are held at once
+    |-> parser:  each chunk is added to a TEST_RESULTS_BUILDER as soon as it is read
+    |-> writers: the first output format is written in this process and the others each in their own process at the same time
+                 (one for each other CPU), so the writers overlap each other rather than running one after the other
+    Every output holds a requirement's results of all devices together (a row of the .csv, a requirement sheet, its statistics),
+    so the writers start once the last device is parsed. The writer processes are forked then, so they share the results instead of copying them.
+"""
+from concurrent.futures import ProcessPoolExecutor, Future
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Any
+import src.logfile_reading as lf
+import src.profiling as profiling
+from src.logfile_following import end_of_complete_devices
+from src.output_writers import OUTPUT_WRITERS, write_results
+
+# Bytes read from the logfile at a time by the reader stage
+PIPELINE_CHUNK_SIZE = 1 << 22
+
+# Most chunks read ahead of the parser, so at most about PIPELINE_QUEUE_SIZE*PIPELINE_CHUNK_SIZE bytes of the logfile are held
+PIPELINE_QUEUE_SIZE = 4
+
+# Put in the queue by the reader once the whole logfile has been read
+_END_OF_LOGFILE = None
+
+def _put(chunks:queue.Queue, item:Any, stop:threading.Event) -> bool:
+    "Waits for room in the queue to put item, returns False (without putting it) if the pipeline is stopped first."
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def read_chunks(logfile:str, chunks:queue.Queue, stop:threading.Event, chunk_size:int=PIPELINE_CHUNK_SIZE) -> None:
+    """Reader stage, puts the logfile in chunks that end after a TEST_SUMMARY row (the rest of the logfile is the last chunk) into chunks.
+        Ends with _END_OF_LOGFILE, or the exception that stopped it.
+    """
+    try:
+        with open(logfile, mode="rb") as f:
+            pending = b""
+            while chunk := f.read(chunk_size):
+                data = pending + chunk
+                end = end_of_complete_devices(data)
+                if end and not _put(chunks, data[:end], stop):
+                    return
+                pending = data[end:]
+            if pending and not _put(chunks, pending, stop):
+                return
+    except Exception as e:
+        _put(chunks, e, stop)
+        return
+    _put(chunks, _END_OF_LOGFILE, stop)
+
+# The results being written, inherited by the writer processes when they are forked (see run_pipeline())
+_forked_results: lf.TEST_RESULTS|None = None
+
+def _write_forked_results(output_name:str, output_format:str, writer_options:dict[str,dict[str,Any]]|None) -> None:
+    "Writer process forked once the results were complete, writes its output format from the results it inherited."
+    write_results(_forked_results, output_name, [output_format], writer_options)
+
+def run_pipeline(logfile:str, output_name:str, output_formats:list[str], writer_options:dict[str,dict[str,Any]]|None=None,
+                 encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS, results_filter:lf.RESULTS_FILTER|None=None,
+                 queue_size:int=PIPELINE_QUEUE_SIZE, chunk_size:int=PIPELINE_CHUNK_SIZE) -> lf.TEST_RESULTS:
+    "Interprets the logfile and writes output_name.<format> of each output format, as a pipeline (see the module docstring), returns the results."
+    global _forked_results
+    for output_format in output_formats:
+        if output_format not in OUTPUT_WRITERS:
+            raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(OUTPUT_WRITERS)}")
+
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_chunks, args=(logfile, chunks, stop, chunk_size), name="logfile reader", daemon=True)
+    reader.start()
+    try:
+        builder = lf.TEST_RESULTS_BUILDER(logfile, encoding, encoding_errors, results_filter=results_filter)
+        with profiling.stage("parse chunks") as stage:
+            while (chunk := chunks.get()) is not _END_OF_LOGFILE:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                builder.add_data(chunk)
+                stage.add(len(chunk), "bytes")
+        with profiling.stage("build arrays") as stage:
+            results = builder.results()
+            stage.add(results.values.size, "cells")
+    finally:
+        stop.set()
+        reader.join() # Before forking the writers
+
+    # One writer process for each CPU this process is not using, the rest of the output formats are written in this process
+    spare_cpus = max((os.cpu_count() or 1) - 1, 0)
+    other_formats = output_formats[1:1+spare_cpus]
+    own_formats = [output_format for output_format in output_formats if output_format not in other_formats]
+    with profiling.stage("write outputs"): # Only the output formats written in this process are timed on their own
+        if not other_formats:
+            write_results(results, output_name, own_formats, writer_options)
+            return results
+
+        # Forked writers share the results with this process, elsewhere (e.g. Windows) they are copied to each writer
+        forked = "fork" in multiprocessing.get_all_start_methods()
+        _forked_results = results if forked else None
+        try:
+            with ProcessPoolExecutor(max_workers=len(other_formats), initializer=profiling.discard,
+                                     mp_context=multiprocessing.get_context("fork") if forked else None) as writers:
+                written: list[Future] = [writers.submit(_write_forked_results, output_name, output_format, writer_options) if forked else
+                                         writers.submit(write_results, results, output_name, [output_format], writer_options)
+                                         for output_format in other_formats]
+                write_results(results, output_name, own_formats, writer_options)
+                for future in written:
+                    future.result()
+        finally:
+            _forked_results = None
+    return results
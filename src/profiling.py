@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from typing import ContextManager, Generator, TextIO
+import cProfile
+import sys
+import time
+
+# Stages are only timed once enable() has been called (e.g. by --profile), until then stage() returns a context manager that does nothing.
+# Stages are around whole passes (parsing a logfile, writing a sheet), never around single rows or cells, so the cost when disabled is one call each.
+
+@dataclass
+class STAGE:
+    """The time spent in one stage of a run, all the times a stage of the same name is entered inside the same parent stage add up.
+        |-> calls:      Number of times the stage was entered
+        |-> count, unit: What the stage processed (e.g. 2000000 "cells"), for its throughput
+        |-> peak_mb:    Peak resident memory of the process while in the stage (see peak_rss_mb())
+    """
+    name:       str
+    depth:      int
+    calls:      int = 0
+    seconds:    float = 0.0
+    count:      int = 0
+    unit:       str = ""
+    peak_mb:    float|None = None
+    children:   dict[str,"STAGE"] = field(default_factory=dict)
+
+    def add(self, count:int, unit:str) -> None:
+        "Counts count more units processed by the stage."
+        self.count += count
+        self.unit = unit
+
+class _DISABLED_STAGE:
+    "What stage() returns when profiling is not enabled."
+    def __enter__(self) -> "_DISABLED_STAGE":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def add(self, count:int, unit:str) -> None:
+        pass
+
+_DISABLED = _DISABLED_STAGE()
+
+def peak_rss_mb() -> float|None:
+    "Peak resident memory of this process since it started or since reset_peak_rss(), None where it can't be read (e.g. Windows)."
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+def reset_peak_rss() -> None:
+    "Starts measuring the peak resident memory again from the current memory (Linux only, elsewhere the peak is that of the whole run)."
+    try:
+        with open("/proc/self/clear_refs", mode="w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+class PROFILER:
+    "Times each stage of a run, and optionally profiles every function call with cProfile."
+    def __init__(self, cprofile_path:str|None=None):
+        self.root = STAGE("run", depth=-1)
+        self.stack = [self.root]
+        self.start = time.perf_counter()
+        self.cprofile_path = cprofile_path
+        self.cprofile = cProfile.Profile() if cprofile_path is not None else None
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        reset_peak_rss()
+
+    @contextmanager
+    def stage(self, name:str) -> Generator[STAGE,None,None]:
+        parent = self.stack[-1]
+        current = parent.children.get(name)
+        if current is None:
+            current = parent.children[name] = STAGE(name, depth=parent.depth+1)
+        self._take_peak(parent)
+        self.stack.append(current)
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current.seconds += time.perf_counter() - start
+            current.calls += 1
+            self._take_peak(current)
+            self.stack.pop()
+            parent.peak_mb = max(parent.peak_mb or 0, current.peak_mb or 0) or None # The parent's peak includes its children's
+
+    def _take_peak(self, stage:STAGE) -> None:
+        "Adds the peak memory since the last reset to the stage's peak."
+        peak = peak_rss_mb()
+        if peak is not None:
+            stage.peak_mb = max(stage.peak_mb or 0, peak)
+
+    def finish(self) -> None:
+        "Stops timing the run, and writes the cProfile statistics (open them with pstats, snakeviz, ...)."
+        self.root.seconds = time.perf_counter() - self.start
+        self._take_peak(self.root)
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+
+    def report(self, file:TextIO=sys.stderr) -> None:
+        "Prints every stage, nested under the stage it ran in, with its share of the run's time, throughput and peak memory."
+        total = self.root.seconds or time.perf_counter() - self.start
+        print(f"{'Stage':<40}  {'Calls':>5}  {'Seconds':>8}  {'% Run':>6}  {'Processed':>18}  {'Per Second':>14}  {'Peak MB':>8}", file=file)
+        def print_stage(stage:STAGE) -> None:
+            processed = f"{stage.count:,} {stage.unit}" if stage.unit else ""
+            rate = f"{stage.count/stage.seconds:,.0f}/s" if stage.unit and stage.seconds else ""
+            peak = f"{stage.peak_mb:.1f}" if stage.peak_mb is not None else ""
+            print(f"{'  '*stage.depth + stage.name:<40}  {stage.calls:>5}  {stage.seconds:>8.3f}  {100*stage.seconds/total if total else 0:>5.1f}%  "
+                  f"{processed:>18}  {rate:>14}  {peak:>8}", file=file)
+            for child in stage.children.values():
+                print_stage(child)
+        for stage in self.root.children.values():
+            print_stage(stage)
+        print(f"{'Total':<40}  {'':>5}  {total:>8.3f}  {100:>5.1f}%  {'':>18}  {'':>14}  {self.root.peak_mb or 0:>8.1f}", file=file)
+        if self.cprofile_path is not None:
+            print(f"cProfile statistics written to {self.cprofile_path} (python -m pstats {self.cprofile_path})", file=file)
+
+_profiler: PROFILER|None = None
+
+def enable(cprofile_path:str|None=None) -> PROFILER:
+    "Starts timing the stages of this process, with cProfile as well if cprofile_path is given."
+    global _profiler
+    _profiler = PROFILER(cprofile_path)
+    return _profiler
+
+def disable() -> PROFILER|None:
+    "Stops timing stages, returns the profiler that was timing them."
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.finish()
+    return profiler
+
+def discard() -> None:
+    "Stops timing stages without writing or reporting anything, e.g. in a process forked from one that is being profiled."
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.cprofile is not None:
+        profiler.cprofile.disable()
+
+def stage(name:str) -> ContextManager[STAGE|_DISABLED_STAGE]:
+    """Times what runs inside it as a stage, nested in the stage it is in, when profiling is enabled.
+        e.g. with profiling.stage("xlsx: requirement sheets") as s: ... s.add(cell_count, "cells")
+    """
+    if _profiler is None:
+        return _DISABLED
+    return _profiler.stage(name)
@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+import warnings
+import numpy as np
+import src.logfile_reading as lf
+
+# Percentiles of each requirement's values reported in the statistics
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+ALL_SITES = "All Sites"
+
+STATISTICS_HEADERS = ["Group", "ID", "Test Name", "Units", "Lower Limit", "Upper Limit", "Count", "Mean", "Std Dev", "Min",
+                      *[f"P{p}" for p in PERCENTILES], "Max", "Fails", "Yield %", "Cp", "Cpk"]
+
+@dataclass
+class REQUIREMENT_STATISTICS:
+    """Statistics of every requirement, across all sites and for each site. Every array is [group, requirement].
+        |-> groups:         The label of each group of devices, ALL_SITES then "Site N" for each site
+        |-> config_rows:    The requirements, in the same order as the columns of TEST_RESULTS
+        |-> lower_limits, upper_limits: The limits of each requirement (NaN if it has none), one per requirement
+        |-> count:          Number of measurements (devices that have a value for the requirement)
+        |-> mean, std:      Mean and sample standard deviation of the values
+        |-> minimum, maximum: Smallest and largest values
+        |-> percentiles:    [group, percentile, requirement] values at each of PERCENTILES
+        |-> fail_count:     Measurements marked as failing (F) by the tester
+        |-> yield_fraction: Fraction of the measurements that passed
+        |-> cp, cpk:        Process capability against the limits (cp needs both limits, cpk uses whichever there are)
+    """
+    groups:         list[str]
+    config_rows:    list[lf.TEST_DATA_CONFIG]
+    lower_limits:   np.ndarray
+    upper_limits:   np.ndarray
+    count:          np.ndarray
+    mean:           np.ndarray
+    std:            np.ndarray
+    minimum:        np.ndarray
+    maximum:        np.ndarray
+    percentiles:    np.ndarray
+    fail_count:     np.ndarray
+    yield_fraction: np.ndarray
+    cp:             np.ndarray
+    cpk:            np.ndarray
+
+    def rows(self) -> list[list]:
+        "The statistics as a table (with the columns of STATISTICS_HEADERS), a row for each requirement of each group. Statistics that can't be calculated are NaN."
+        table = []
+        for g, group in enumerate(self.groups):
+            columns = [self.count[g], self.mean[g], self.std[g], self.minimum[g], *self.percentiles[g], self.maximum[g],
+                       self.fail_count[g], 100*self.yield_fraction[g], self.cp[g], self.cpk[g]]
+            for r, (requirement, *statistics) in enumerate(zip(self.config_rows, *(column.tolist() for column in columns))):
+                table.append([group, requirement.test_id, requirement.name, requirement.unit,
+                              self.lower_limits[r].item(), self.upper_limits[r].item(), *statistics])
+        return table
+
+def requirement_limits(config_rows:list[lf.TEST_DATA_CONFIG]) -> tuple[np.ndarray,np.ndarray]:
+    """(lower_limits, upper_limits) of each requirement, NaN where there is no limit.
+        The tester writes the upper limit first, so TEST_DATA_CONFIG.min is the upper limit and .max the lower one
+        (as labelled in the outputs' "Max", "Min" headers).
+    """
+    lower = np.array([np.nan if c.max is None else c.max for c in config_rows], dtype=np.float64)
+    upper = np.array([np.nan if c.min is None else c.min for c in config_rows], dtype=np.float64)
+    return lower, upper
+
+def compute_requirement_statistics(results:lf.TEST_RESULTS) -> REQUIREMENT_STATISTICS:
+    """Calculates the statistics of every requirement with array operations over the columns of results, for all sites and each site.
+        Missing measurements (NaN) are left out.
+    """
+    values, passed = results.values, results.passed
+    lower, upper = requirement_limits(results.config_rows)
+
+    sites = np.unique(results.site_nums).tolist()
+    groups = [ALL_SITES] + [f"Site {site}" for site in sites]
+    device_masks = [np.ones(len(values), dtype=np.bool_)] + [results.site_nums == site for site in sites]
+
+    statistics = {name: [] for name in ("count", "mean", "std", "minimum", "maximum", "percentiles", "fail_count")}
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning) # Statistics of groups without (enough) values are NaN
+        for device_mask in device_masks:
+            group_values = values if device_mask.all() else values[device_mask]
+            measured = ~np.isnan(group_values)
+            statistics["count"].append(measured.sum(axis=0))
+            statistics["mean"].append(np.nanmean(group_values, axis=0))
+            statistics["std"].append(np.nanstd(group_values, axis=0, ddof=1))
+            statistics["minimum"].append(np.nanmin(group_values, axis=0) if len(group_values) else np.full(values.shape[1], np.nan))
+            statistics["maximum"].append(np.nanmax(group_values, axis=0) if len(group_values) else np.full(values.shape[1], np.nan))
+            statistics["percentiles"].append(np.nanpercentile(group_values, PERCENTILES, axis=0) if len(group_values)
+                                             else np.full((len(PERCENTILES), values.shape[1]), np.nan))
+            statistics["fail_count"].append((measured & ~passed[device_mask]).sum(axis=0))
+        arrays = {name: np.array(columns) for name, columns in statistics.items()}
+
+        count, mean, std = arrays["count"], arrays["mean"], arrays["std"]
+        yield_fraction = (count - arrays["fail_count"]) / count
+        cp = (upper - lower) / (6*std)
+        cpk = np.fmin((upper - mean) / (3*std), (mean - lower) / (3*std)) # fmin ignores the side without a limit
+
+    return REQUIREMENT_STATISTICS(groups=groups, config_rows=results.config_rows, lower_limits=lower, upper_limits=upper,
+                                  yield_fraction=yield_fraction, cp=cp, cpk=cpk, **arrays)
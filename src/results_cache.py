@@ -0,0 +1,169 @@
+from dataclasses import asdict
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import src.logfile_reading as lf
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "ets_logfile_interpreter")
+DEFAULT_CACHE_SIZE_MB = 1024
+
+# Temporary files of entries not finished this long after they were last written are from a run that was killed, so are deleted
+STALE_TEMPORARY_SECONDS = 60 * 60
+
+# Change whenever TEST_RESULTS or the way a logfile is interpreted changes, so older entries are read again
+CACHE_FORMAT_VERSION = 3
+
+# String fields of TEST_SUMMARY stored by column, each as its distinct strings and an index into them for each device
+SUMMARY_STRING_FIELDS = ("time_completed", "serial_num", "unknown1", "unknown2", "unknown3", "unknown4")
+
+class RESULTS_CACHE:
+    """An on-disk cache of the TEST_RESULTS of logfiles, so a logfile that has already been interpreted is loaded instead of parsed.
+        |-> Each logfile has one entry (a .npz file of the arrays), named after the logfile's path, or its contents with by_hash.
+        |-> An entry is only used if the logfile still has the same size and modification time (or contents) and was read
+            with the same encoding, otherwise it is interpreted again and the entry is replaced.
+        |-> Once the entries take up more than max_mb, the least recently used ones are deleted.
+    """
+    def __init__(self, directory:str=DEFAULT_CACHE_DIRECTORY, max_mb:float=DEFAULT_CACHE_SIZE_MB, by_hash:bool=False):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 2**20)
+        self.by_hash = by_hash
+
+    def _logfile_key(self, logfile:str) -> dict:
+        "What identifies the logfile as it is now."
+        if self.by_hash:
+            return {"sha256": lf.hash_logfile(logfile)}
+        stat = os.stat(logfile)
+        return {"path": os.path.abspath(logfile), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _entry_path(self, key:dict) -> str:
+        name = key["sha256"] if self.by_hash else hashlib.sha256(key["path"].encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def load(self, logfile:str, encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS) -> lf.TEST_RESULTS|None:
+        "The cached TEST_RESULTS of the logfile, None if it has not been cached (or has changed since). Then deletes the least recently used entries if the cache is too big."
+        key = self._logfile_key(logfile)
+        entry_path = self._entry_path(key)
+        try:
+            with np.load(entry_path, allow_pickle=False) as entry:
+                metadata = json.loads(str(entry["metadata"]))
+                if any(metadata.get(name) != value for name, value in self._identity(key, encoding, encoding_errors).items()):
+                    return None
+                results = results_from_arrays(metadata, entry)
+        except (OSError, ValueError, KeyError):
+            return None # Missing, or unreadable (e.g. an older format or another process writing it), so read the logfile again
+        try:
+            os.utime(entry_path) # Mark it as recently used
+        except FileNotFoundError:
+            pass # Evicted or being replaced by another run since it was loaded, the results are still good
+        self.evict() # So the cache is kept under max_mb on runs that only load, e.g. after --cache-size is lowered
+        return results
+
+    def save(self, logfile:str, results:lf.TEST_RESULTS, encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS) -> None:
+        "Caches the TEST_RESULTS of the logfile, then deletes the least recently used entries if the cache is too big."
+        key = self._logfile_key(logfile)
+        entry_path = self._entry_path(key)
+        metadata = self._identity(key, encoding, encoding_errors) | {
+            "config_rows":  [{k: v for k, v in asdict(c).items() if k != "type"} for c in results.config_rows],
+            "issues":       results.issues}
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first, so no other run ever loads a partly written entry
+        temporary_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, mode="wb") as f:
+                np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays_from_results(results))
+            os.replace(temporary_path, entry_path)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.evict()
+
+    def _identity(self, key:dict, encoding:str, encoding_errors:str) -> dict:
+        "What an entry must have been saved with to be used for the logfile."
+        return {"version": CACHE_FORMAT_VERSION, "logfile": key, "encoding": encoding, "encoding_errors": encoding_errors}
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_bytes.
+            |-> The temporary files of entries being written count towards max_bytes, those left by killed runs (see STALE_TEMPORARY_SECONDS) are deleted
+            |-> Entries and temporary files deleted by another run while this one is looking at them are skipped
+        """
+        entries, temporary_bytes = [], 0
+        stale_before = time.time() - STALE_TEMPORARY_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".npz"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(".tmp"):
+                    if stat.st_mtime < stale_before:
+                        os.remove(entry.path)
+                    else:
+                        temporary_bytes += stat.st_size
+            except FileNotFoundError:
+                pass # Evicted, replaced or finished by another run
+        total_bytes = temporary_bytes + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # Already evicted by another run
+            total_bytes -= size
+
+    def read_test_results(self, logfile:str, encoding:str=lf.LOGFILE_ENCODING, encoding_errors:str=lf.DEFAULT_ENCODING_ERRORS,
+                          workers:int=1, results_filter:lf.RESULTS_FILTER|None=None) -> tuple[lf.TEST_RESULTS,bool]:
+        """Like lf.read_test_results(), but loads the results from the cache if it can, returns (results, if they came from the cache).
+            The whole logfile is always read and cached, so any results_filter can be applied to the cached results later.
+        """
+        results = self.load(logfile, encoding, encoding_errors)
+        cached = results is not None
+        if not cached:
+            results = lf.read_test_results(logfile, encoding=encoding, encoding_errors=encoding_errors, workers=workers)
+            self.save(logfile, results, encoding, encoding_errors)
+        if results_filter is not None:
+            results = results_filter.apply(results)
+        return results, cached
+
+def arrays_from_results(results:lf.TEST_RESULTS) -> dict[str,np.ndarray]:
+    "The arrays to store the TEST_RESULTS as, its config rows and issues go in the metadata."
+    arrays = {"values":         results.values,
+              "packed_passed":  results.packed_passed,
+              "packed_present": results.packed_present,
+              "issue_codes":    results.issue_codes,
+              "site_nums":      results.site_nums,
+              "bin_nums":       results.bin_nums,
+              "device_passed":  results.device_passed,
+              "device_indexes": results.device_indexes,
+              "test_nums":      results.test_nums}
+    for field in SUMMARY_STRING_FIELDS:
+        strings, codes = np.unique(np.array([getattr(s, field) for s in results.test_summaries], dtype=np.str_), return_inverse=True)
+        arrays[f"{field}_strings"] = strings
+        arrays[f"{field}_codes"] = codes.astype(np.uint32)
+    return arrays
+
+def results_from_arrays(metadata:dict, arrays) -> lf.TEST_RESULTS:
+    "Rebuilds the TEST_RESULTS saved by arrays_from_results()."
+    config_rows = [lf.TEST_DATA_CONFIG(**c) for c in metadata["config_rows"]]
+    site_nums, bin_nums, device_passed = arrays["site_nums"], arrays["bin_nums"], arrays["device_passed"]
+    columns = {field: arrays[f"{field}_strings"][arrays[f"{field}_codes"]].tolist() for field in SUMMARY_STRING_FIELDS} | {
+        "site_num": site_nums.tolist(), "passed": device_passed.tolist(), "bin_num": bin_nums.tolist()}
+    test_summaries = list(map(lf.TEST_SUMMARY, *(columns[field] for field in lf.TEST_SUMMARY.__dataclass_fields__ if field != "type")))
+    return lf.TEST_RESULTS(config_rows=    config_rows,
+                           test_ids=       np.array([c.test_id for c in config_rows], dtype=np.str_),
+                           values=         arrays["values"],
+                           packed_passed=  arrays["packed_passed"],
+                           packed_present= arrays["packed_present"],
+                           issue_codes=    arrays["issue_codes"],
+                           issues=         metadata["issues"],
+                           test_summaries= test_summaries,
+                           site_nums=      site_nums,
+                           bin_nums=       bin_nums,
+                           device_passed=  device_passed,
+                           device_indexes= arrays["device_indexes"],
+                           test_nums=      arrays["test_nums"])